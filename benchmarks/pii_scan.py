@@ -0,0 +1,148 @@
+"""
+Benchmark: PII scanning throughput
+Compares the single-pass combined scanner with one findall per pattern over
+synthetic page text from 10 KB to 10 MB, with a sprinkling of PII. The last
+column rescans the page through the chunk cache after a small edit, as happens
+between pre_checks. Block mode's stop-at-first-finding streaming scan is then
+compared with joining the segments and collecting every match, by time and peak
+memory. Finally, PII values are run together so their matches overlap, and every
+match a pattern finds on its own must also come out of the single-pass scanner;
+the script exits non-zero if one is lost.
+
+Usage:
+    python benchmarks/pii_scan.py [--sizes 10e3,100e3,1e6,10e6] [--pii-rate 0.002] [--no-digits] [--cache-bytes 33554432]
+
+Requires: websockets, httpx (SDK import)
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sentinels"))
+from pii_sentinel import PIISentinel
+from sdk.pii_scanner import IncrementalScanner
+
+WORDS = ("the", "order", "account", "shipping", "checkout", "profile", "settings", "cart",
+         "product", "review", "delivery", "support", "item", "price", "total", "and")
+PII = ("jane.doe@example.com", "123-45-6789", "4111111111111111", "(555) 123-4567",
+       "192.168.0.12", "07/04/1986")
+
+
+def make_text(rng, size, pii_rate, digits):
+    parts = []
+    length = 0
+    while length < size:
+        if rng.random() < 0.1:
+            parts.append("\n")  # innerText puts block elements on their own lines
+        if rng.random() < pii_rate:
+            token = rng.choice(PII if digits else PII[:1])
+        elif digits and rng.random() < 0.05:
+            token = str(rng.randrange(1, 999))  # Prices, counts: digits that are not PII
+        else:
+            token = rng.choice(WORDS)
+        parts.append(token)
+        length += len(token) + 1
+    return " ".join(parts)
+
+
+def overlapping_text(rng, count):
+    """PII values joined by nothing or a single separator, so neighbours overlap (IP then SSN, etc.)."""
+    return "\n".join("".join(rng.choice(PII + ("1", "12", "-", ".", "/", " ")) for _ in range(rng.randint(2, 6)))
+                     for _ in range(count))
+
+
+def per_pattern(patterns, text):
+    """The previous approach: one findall per pattern."""
+    return sum(len(p.findall(text)) for p in patterns.values())
+
+
+def peak(fn):
+    """Run fn once; return (seconds, peak bytes allocated meanwhile)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak_bytes
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10e3,100e3,1e6,10e6")
+    parser.add_argument("--pii-rate", type=float, default=0.002)
+    parser.add_argument("--no-digits", action="store_true", help="Text without digits exercises the prefilters")
+    parser.add_argument("--cache-bytes", type=int, default=32 << 20, help="Chunk cache size (pii.incremental.maxBytes)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    sentinel = PIISentinel()
+    scanner = sentinel.scanner
+    legacy = {name: re.compile(p, re.IGNORECASE) for name, p in scanner.patterns.items()}
+    rng = random.Random(args.seed)
+
+    print(f"Patterns: {len(scanner.patterns)}, PII rate {args.pii_rate}, digits={not args.no_digits}")
+    print(f"{'size':>10}{'per-pattern ms':>16}{'single-pass ms':>16}{'speedup':>9}{'MB/s':>8}{'matches':>14}"
+          f"{'rescan ms':>11}{'chunk hits':>12}")
+    for size in (int(float(s)) for s in args.sizes.split(",")):
+        text = make_text(rng, size, args.pii_rate, not args.no_digits)
+        repeat = 5 if size <= 1_000_000 else 1
+        old_s, old_n = timed(lambda: per_pattern(legacy, text), repeat)
+        new_s, findings = timed(lambda: list(scanner.finditer(text)), repeat)
+
+        incremental = IncrementalScanner(scanner, max_bytes=args.cache_bytes)
+        incremental.scan(text)
+        middle = len(text) // 2
+        edited = text[:middle] + "\nCart updated: 3 items\n" + text[middle:]
+        hits, misses = incremental.hits, incremental.misses
+        rescan_s, _ = timed(lambda: incremental.scan(edited), 1)
+        chunk_hits = incremental.hits - hits
+        chunk_total = chunk_hits + incremental.misses - misses
+
+        print(f"{size / 1000:>8.0f}KB{old_s * 1000:>16.1f}{new_s * 1000:>16.1f}{old_s / new_s:>8.1f}x"
+              f"{len(text) / new_s / 1e6:>8.1f}{f'{old_n}/{len(findings)}':>14}"
+              f"{rescan_s * 1000:>11.1f}{chunk_hits / max(1, chunk_total):>12.0%}")
+
+    # Block mode: a large page plus blocking elements, with the only PII near the start
+    page = "Your account: jane.doe@example.com\n" + make_text(rng, int(float(args.sizes.split(",")[-1])), 0, False)
+    segments = [page] + ["Accept all cookies"] * 20
+
+    def joined():
+        all_text = page
+        for text in segments[1:]:
+            all_text += " " + text
+        return [m for p in legacy.values() for m in p.findall(all_text)]
+
+    sentinel.incremental = None  # Measure the scan itself, not the chunk cache
+    old_s, old_peak = peak(joined)
+    new_s, new_peak = peak(lambda: next(sentinel.iter_pii(segments), None))
+    print(f"\nBlock mode on {len(page) / 1e6:.1f} MB: join + findall {old_s * 1000:.1f} ms / {old_peak / 1e6:.1f} MB peak, "
+          f"streaming first finding {new_s * 1000:.2f} ms / {new_peak / 1e3:.1f} KB peak")
+
+    text = overlapping_text(rng, 5000)
+    expected = {(name, m.start(), m.end()) for name, p in legacy.items() for m in p.finditer(text)}
+    lost = expected - {(name, s, e) for name, s, e, _ in scanner.finditer(text)}
+    print(f"\nOverlapping PII: {len(expected)} per-pattern matches, {len(lost)} lost by the single-pass scanner")
+    for name, s, e in sorted(lost, key=lambda m: m[1])[:5]:
+        print(f"  lost {name} {text[s:e]!r} in {text[max(0, s - 20):e + 20]!r}")
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
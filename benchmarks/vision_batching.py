@@ -0,0 +1,102 @@
+"""
+Benchmark: Vision micro-batching
+Fires bursts of concurrent VisionSentinel inferences at a local stand-in backend
+that serves one request at a time (like a single GPU) and charges a fixed cost per
+call plus a smaller cost per image. Compares wall time and latency with batching
+off and on.
+
+Usage:
+    python benchmarks/vision_batching.py [--requests 32] [--window-ms 5] [--max-batch 4]
+
+Requires: httpx, websockets (SDK import)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sentinels"))
+from vision_sentinel import VisionSentinel
+from sdk.endpoint_pool import EndpointPool
+from sdk.micro_batcher import MicroBatcher
+
+CALL_MS = 120  # Fixed cost per backend call (scheduling, prompt processing)
+IMAGE_MS = 30  # Marginal cost per image in a call
+
+
+def stand_in():
+    device = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            images = body["images"]
+            with device:
+                time.sleep((CALL_MS + IMAGE_MS * len(images)) / 1000.0)
+            if self.path.endswith("_batch"):
+                payload = {"responses": ["a cookie banner"] * len(images)}
+            else:
+                payload = {"response": "a cookie banner"}
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+
+async def measure(url, args, batching):
+    sentinel = VisionSentinel()
+    sentinel.pool = EndpointPool([url])
+    sentinel.max_concurrent = args.max_batch
+    sentinel.batcher = MicroBatcher(sentinel._infer_batch, args.window_ms / 1000.0, args.max_batch) if batching else None
+
+    async def one(i):
+        start = time.perf_counter()
+        await sentinel._infer(f"req-{i}")
+        return (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(one(i) for i in range(args.requests))))
+    wall = time.perf_counter() - started
+    await sentinel.on_shutdown()
+    batches = sentinel.batcher.stats["batches"] if batching else args.requests
+    return wall, latencies, batches
+
+
+async def run(args):
+    server, url = stand_in()
+    print(f"Requests: {args.requests} concurrent, backend {CALL_MS}ms/call + {IMAGE_MS}ms/image, "
+          f"window {args.window_ms}ms, maxBatch {args.max_batch}")
+    print(f"{'':<12}{'wall s':>8}{'req/s':>8}{'p50 ms':>8}{'max ms':>8}{'calls':>7}")
+    for name, batching in (("single", False), ("batched", True)):
+        wall, lat, calls = await measure(url, args, batching)
+        print(f"{name:<12}{wall:>8.2f}{args.requests / wall:>8.1f}{lat[len(lat) // 2]:>8.0f}{lat[-1]:>8.0f}{calls:>7}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: Vision multi-endpoint pool
+Runs concurrent VisionSentinel inferences against several local stand-in
+inference servers (fast, slow and dead) and reports how the EndpointPool
+spread the load, which circuits opened, and per-endpoint latency.
+
+Usage:
+    python benchmarks/vision_endpoints.py [--requests 40] [--concurrency 8]
+
+Requires: httpx, websockets (SDK import)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sentinels"))
+from vision_sentinel import VisionSentinel
+from sdk.endpoint_pool import EndpointPool
+
+
+def stand_in(delay_s):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply({"models": []})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay_s)
+            self._reply({"response": "a cookie banner"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+
+def dead_url():
+    """A URL on a port nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api/generate"
+
+
+async def run(args):
+    servers = []
+    urls = []
+    for delay in (0.05, 0.05, 0.4):
+        server, url = stand_in(delay)
+        servers.append(server)
+        urls.append(url)
+    urls.append(dead_url())
+
+    sentinel = VisionSentinel()
+    sentinel.pool = EndpointPool(urls, failure_threshold=2, cooldown=60, slow_ms=args.slow_ms)
+    sentinel.max_concurrent = args.concurrency
+
+    async def noop(*a, **k):
+        pass
+    sentinel.update_context = noop
+
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            verdict = await sentinel._infer(f"req-{i}")
+            return verdict, (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    wall = time.perf_counter() - started
+    await sentinel.on_shutdown()
+    for server in servers:
+        server.shutdown()
+
+    ok = sum(1 for verdict, _ in results if verdict not in (None, VisionSentinel._FAILED))
+    lat = sorted(ms for _, ms in results)
+    print(f"\nRequests: {args.requests}, concurrency {args.concurrency}, wall {wall:.2f}s")
+    print(f"Successful verdicts: {ok}/{args.requests}, p50 {lat[len(lat) // 2]:.0f}ms, max {lat[-1]:.0f}ms")
+    print(f"{'endpoint':<42}{'state':>10}{'reqs':>6}{'fails':>6}{'ewma ms':>9}")
+    for url, st in sentinel.endpoint_stats().items():
+        ewma = st["latencyEwmaMs"] if st["latencyEwmaMs"] is not None else "-"
+        print(f"{url:<42}{st['state']:>10}{st['requests']:>6}{st['failures']:>6}{ewma:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow-ms", type=float, default=300, help="Circuit-break endpoints slower than this")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
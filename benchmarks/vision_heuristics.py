@@ -0,0 +1,86 @@
+"""
+Benchmark: Vision pixel-heuristic first stage
+Runs the NumPy classifier over synthetic pages (plain, dimmed modal, cookie bar)
+and reports how often it decides on its own, how often it is right when it does,
+and its latency. Undecided screenshots would go on to the vision model.
+
+Usage:
+    python benchmarks/vision_heuristics.py [--scenes 60] [--high 0.7] [--low 0.15]
+
+Requires: NumPy, Pillow
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sdk.pixel_heuristics import classify_screenshot
+from vision_preprocess import make_scene
+
+KINDS = ("none", "modal", "banner")
+
+
+def make_cookie_bar_scene(rng, width, height):
+    """Plain page with a full-width consent bar along the bottom edge."""
+    shot, _ = make_scene(rng, width, height, with_modal=False)
+    img = Image.open(io.BytesIO(base64.b64decode(shot)))
+    draw = ImageDraw.Draw(img)
+    bar_h = rng.randrange(height // 10, height // 5)
+    draw.rectangle((0, height - bar_h, width, height), fill=(33, 37, 41))
+    draw.rectangle((width - 220, height - bar_h + 20, width - 40, height - bar_h + 60), fill=(13, 110, 253))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--high", type=float, default=0.7, help="Score for a confident obstacle verdict")
+    parser.add_argument("--low", type=float, default=0.15, help="Score below which every cue means 'none'")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = {kind: {"n": 0, "decided": 0, "correct": 0, "ms": []} for kind in KINDS}
+
+    for i in range(args.scenes):
+        kind = KINDS[i % len(KINDS)]
+        if kind == "banner":
+            shot = make_cookie_bar_scene(rng, args.width, args.height)
+        else:
+            shot, _ = make_scene(rng, args.width, args.height, with_modal=(kind == "modal"))
+
+        start = time.perf_counter()
+        decided, verdict, _ = classify_screenshot(shot, args.high, args.low)
+        row = rows[kind]
+        row["ms"].append((time.perf_counter() - start) * 1000)
+        row["n"] += 1
+        if decided:
+            row["decided"] += 1
+            row["correct"] += (verdict or "none") == kind
+
+    print(f"Scenes: {args.scenes} @ {args.width}x{args.height}, high={args.high}, low={args.low}")
+    print(f"{'scene':<10}{'decided':>10}{'correct':>10}{'avg ms':>10}{'max ms':>10}")
+    for kind, row in rows.items():
+        if not row["n"]:
+            continue
+        print(f"{kind:<10}{row['decided'] / row['n']:>10.0%}{row['correct'] / max(1, row['decided']):>10.0%}"
+              f"{sum(row['ms']) / row['n']:>10.1f}{max(row['ms']):>10.1f}")
+    decided = sum(r["decided"] for r in rows.values())
+    correct = sum(r["correct"] for r in rows.values())
+    print(f"First-stage hit rate: {decided}/{args.scenes} ({decided / args.scenes:.0%}), "
+          f"precision {correct}/{max(1, decided)}")
+
+
+if __name__ == "__main__":
+    main()
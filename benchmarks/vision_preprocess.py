@@ -0,0 +1,145 @@
+"""
+Benchmark: Vision screenshot preprocessing
+Compares inference latency and verdict agreement for full-size screenshots
+versus downscaled / ROI-cropped ones, against a local stand-in inference server.
+
+The stand-in mimics an Ollama /api/generate endpoint: it decodes the image,
+sleeps in proportion to its pixel count (like a CPU-bound vision model) and
+answers "modal" when the centre of the image is much brighter than its border.
+
+Usage:
+    python benchmarks/vision_preprocess.py [--scenes 20] [--max-edge 768] [--roi]
+
+Requires: httpx, Pillow
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from PIL import Image, ImageDraw, ImageStat
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sdk.imaging import preprocess_screenshot, union_bounds
+
+BASE_LATENCY_MS = 40
+MS_PER_MEGAPIXEL = 400
+
+
+class StandInModel(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        img = Image.open(io.BytesIO(base64.b64decode(body["images"][0]))).convert("L")
+        w, h = img.size
+        time.sleep((BASE_LATENCY_MS + MS_PER_MEGAPIXEL * (w * h) / 1e6) / 1000.0)
+
+        centre = ImageStat.Stat(img.crop((w // 3, h // 3, 2 * w // 3, 2 * h // 3))).mean[0]
+        border = ImageStat.Stat(img.crop((0, 0, w, max(1, h // 10)))).mean[0]
+        answer = "a modal dialog" if centre - border > 60 else "none"
+
+        data = json.dumps({"response": answer}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_scene(rng, width, height, with_modal):
+    """Render a synthetic page; returns (screenshot_b64, blocking elements)."""
+    img = Image.new("RGB", (width, height), (236, 238, 242))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(width - 200), rng.randrange(height - 80)
+        shade = rng.randrange(90, 200)
+        draw.rectangle((x, y, x + rng.randrange(80, 200), y + rng.randrange(20, 80)), fill=(shade, shade, shade + 20))
+
+    blocking = []
+    if with_modal:
+        img = Image.blend(img, Image.new("RGB", img.size, (0, 0, 0)), 0.6)  # Dimmed backdrop
+        draw = ImageDraw.Draw(img)
+        mw, mh = rng.randrange(width // 3, width // 2), rng.randrange(height // 3, height // 2)
+        left, top = (width - mw) // 2, (height - mh) // 2
+        draw.rectangle((left, top, left + mw, top + mh), fill=(255, 255, 255))
+        draw.rectangle((left + mw - 40, top + 10, left + mw - 10, top + 40), fill=(200, 40, 40))
+        blocking.append({
+            "selector": ".modal",
+            "bounds": {"x": left, "y": top, "width": mw, "height": mh}
+        })
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)  # Matches the Hub's capture settings
+    return base64.b64encode(out.getvalue()).decode("ascii"), blocking
+
+
+def infer(client, url, image_b64):
+    start = time.perf_counter()
+    response = client.post(url, json={"model": "stand-in", "prompt": "obstacle?", "images": [image_b64], "stream": False})
+    latency = (time.perf_counter() - start) * 1000
+    return "modal" in response.json()["response"], latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", type=int, default=20)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--max-edge", type=int, default=768)
+    parser.add_argument("--roi", action="store_true", help="Also crop to the union of blocking rects")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInModel)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+    rng = random.Random(args.seed)
+    rows = {"full": [], "processed": []}
+    sizes = {"full": 0, "processed": 0}
+    prep_ms = 0.0
+    agree = 0
+
+    with httpx.Client(timeout=60.0) as client:
+        for i in range(args.scenes):
+            shot, blocking = make_scene(rng, args.width, args.height, with_modal=(i % 2 == 0))
+
+            t0 = time.perf_counter()
+            roi = union_bounds(blocking) if args.roi else None
+            processed = preprocess_screenshot(shot, args.max_edge, roi)
+            prep_ms += (time.perf_counter() - t0) * 1000
+
+            full_verdict, full_ms = infer(client, url, shot)
+            proc_verdict, proc_ms = infer(client, url, processed)
+            rows["full"].append(full_ms)
+            rows["processed"].append(proc_ms)
+            sizes["full"] += len(shot)
+            sizes["processed"] += len(processed)
+            agree += full_verdict == proc_verdict
+
+    server.shutdown()
+    n = args.scenes
+    print(f"Scenes: {n} @ {args.width}x{args.height}, maxEdge={args.max_edge}, roi={args.roi}")
+    print(f"{'':<12}{'avg ms':>10}{'p95 ms':>10}{'avg KB':>10}")
+    for name in ("full", "processed"):
+        lat = sorted(rows[name])
+        p95 = lat[min(n - 1, int(0.95 * n))]
+        print(f"{name:<12}{sum(lat) / n:>10.1f}{p95:>10.1f}{sizes[name] / n / 1024:>10.1f}")
+    print(f"Preprocessing overhead: {prep_ms / n:.1f} ms/screenshot")
+    print(f"Verdict agreement with full-size baseline: {agree}/{n} ({agree / n:.0%})")
+
+
+if __name__ == "__main__":
+    main()
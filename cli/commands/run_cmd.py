@@ -3,12 +3,18 @@ Starlight CLI - Run Command
 Launches the full CBA constellation (Hub + Sentinels).
 """
 
+import asyncio
 import os
 import sys
+import json
+import ssl
 import subprocess
 import signal
 import time
 import socket
+import urllib.request
+
+from cli.supervisor import LogMultiplexer, ProcessSupervisor
 
 
 def is_port_in_use(port: int) -> bool:
@@ -54,7 +60,91 @@ def discover_sentinels(sentinels_dir: str) -> list:
     return sentinels
 
 
-def execute(intent: str = None, no_sentinels: bool = False):
+def load_config() -> dict:
+    """Read the project's config.json (empty if missing)."""
+    try:
+        with open(os.path.join(os.getcwd(), "config.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def fetch_hub_health(port: int, use_ssl: bool = False):
+    """Return the Hub's /health status, or None if it does not answer yet."""
+    scheme = "https" if use_ssl else "http"
+    # Local self-signed certificates are expected here
+    context = ssl._create_unverified_context() if use_ssl else None
+    try:
+        with urllib.request.urlopen(f"{scheme}://localhost:{port}/health", timeout=0.5, context=context) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+async def wait_for_port(port: int, deadline: float, process=None) -> bool:
+    """Poll until something accepts connections on `port`. Gives up at `deadline` or if `process` exits."""
+    while time.monotonic() < deadline:
+        if is_port_in_use(port):
+            return True
+        if process is not None and process.returncode is not None:
+            return False
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def wait_for_constellation(port: int, sentinels: list, deadline: float, started: float, use_ssl: bool = False) -> dict:
+    """Poll /health until every sentinel still in play has registered and the Hub's browser is ready.
+
+    `sentinels` are supervised children; ones that crashed during startup are not waited for
+    (they keep restarting in the background). Returns
+    {"ready": float | None, "layers": {layer: seconds}, "exited": [names], "complete": bool},
+    with times relative to `started`.
+    """
+    result = {"ready": None, "layers": {}, "exited": [], "complete": False}
+    while time.monotonic() < deadline:
+        result["exited"] = [c.name for c in sentinels if c.done.is_set() or c.quick_failures > 0]
+        status = await asyncio.to_thread(fetch_hub_health, port, use_ssl)
+        if status:
+            now = time.monotonic() - started
+            for entry in status.get("sentinels", []):
+                result["layers"].setdefault(entry.get("layer"), now)
+            if status.get("ready") and result["ready"] is None:
+                result["ready"] = now
+            expected = len(sentinels) - len(result["exited"])
+            if result["ready"] is not None and len(status.get("sentinels", [])) >= expected:
+                result["complete"] = True
+                return result
+        await asyncio.sleep(0.1)
+    return result
+
+
+def print_startup_report(hub_listening: float, startup: dict, total: float):
+    print("  [*] Startup report:")
+    print(f"      {'Hub (port open)':<28}{hub_listening:>7.2f}s")
+    if startup["ready"] is not None:
+        print(f"      {'Hub (browser ready)':<28}{startup['ready']:>7.2f}s")
+    for layer, seconds in sorted(startup["layers"].items(), key=lambda item: item[1]):
+        print(f"      {layer:<28}{seconds:>7.2f}s")
+    for name in startup["exited"]:
+        print(f"      {name:<28}{'crashed':>8}")
+    print(f"      {'Total':<28}{total:>7.2f}s")
+
+
+async def spawn(name: str, args: list, logs: LogMultiplexer):
+    """Start a child process. Its output is drained by `logs` (own console on Windows)."""
+    if sys.platform == "win32":
+        return await asyncio.create_subprocess_exec(*args, creationflags=subprocess.CREATE_NEW_CONSOLE)
+    # Unbuffered so sentinel prints arrive line by line rather than in 8 KB blocks
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        env=env, limit=1024 * 1024
+    )
+    logs.attach(name, process)
+    return process
+
+
+def execute(intent: str = None, no_sentinels: bool = False, startup_timeout: float = 30, log_dir: str = None):
     """Launch the CBA constellation."""
     print("[Starlight] Launching Constellation...")
     
@@ -63,32 +153,73 @@ def execute(intent: str = None, no_sentinels: bool = False):
     if not os.path.exists(hub_path):
         print("[Starlight] ERROR: src/hub.js not found. Are you in a CBA project directory?")
         return False
+
+    try:
+        return asyncio.run(run_constellation(intent, no_sentinels, startup_timeout, log_dir))
+    except KeyboardInterrupt:
+        # Children were stopped by run_constellation's cleanup
+        print("[Starlight] Constellation stopped.")
+        return True
+
+
+async def run_constellation(intent, no_sentinels, startup_timeout, log_dir):
+    config = load_config()
+    hub_config = config.get("hub", {})
+    port = hub_config.get("port", 8080)
+    use_ssl = bool(hub_config.get("security", {}).get("ssl", {}).get("enabled"))
+    sup_config = config.get("supervisor", {})
+    logs = LogMultiplexer(
+        log_dir=log_dir or sup_config.get("logDir"),
+        max_bytes=sup_config.get("logMaxBytes", 1048576),
+        backups=sup_config.get("logBackups", 3),
+        ring_lines=sup_config.get("ringLines", 500),
+        rate_limit=sup_config.get("rateLimitLines", 50),
+        burst=sup_config.get("rateLimitBurst", 200)
+    )
+    restart_config = sup_config.get("restart", {})
+    supervisor = ProcessSupervisor(
+        lambda name, args: spawn(name, args, logs), logs,
+        backoff=restart_config.get("backoffMs", 500) / 1000.0,
+        max_backoff=restart_config.get("maxBackoffMs", 30000) / 1000.0,
+        max_restarts=restart_config.get("maxRestarts", 5),
+        stable_seconds=restart_config.get("stableSeconds", 30),
+        sample_interval=sup_config.get("sampleIntervalMs", 1000) / 1000.0,
+        memory_limit_mb=sup_config.get("memoryLimitMb"),
+        memory_limits=sup_config.get("memoryLimits", {})
+    )
+    restart_sentinels = restart_config.get("enabled", True)
+    # On demand: `kill -USR1 <pid>` prints the status table
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: print(supervisor.status_table(), flush=True))
+        print(f"  [*] Status table: kill -USR1 {os.getpid()}")
+
+    # Clean up the Hub port
+    if is_port_in_use(port):
+        print(f"  [*] Port {port} in use, cleaning up...")
+        kill_process_on_port(port)
+        deadline = time.monotonic() + 5
+        while is_port_in_use(port) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
     
-    # Clean up port 8080
-    if is_port_in_use(8080):
-        print("  [*] Port 8080 in use, cleaning up...")
-        kill_process_on_port(8080)
-        time.sleep(1)
-    
-    processes = []
+    started = time.monotonic()
+    deadline = started + startup_timeout
     
     try:
         # 1. Launch Hub
         print("  [+] Starting Hub (node src/hub.js)...")
-        if sys.platform == "win32":
-            hub_process = subprocess.Popen(
-                ["node", "src/hub.js"],
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
-        else:
-            hub_process = subprocess.Popen(
-                ["node", "src/hub.js"],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-        processes.append(("Hub", hub_process))
-        time.sleep(2)  # Wait for Hub to initialize
+        hub = await supervisor.start("Hub", ["node", "src/hub.js"], restart=False)
+        # Sentinels can connect as soon as the Hub listens
+        if not await wait_for_port(port, deadline, hub.process):
+            reason = "exited" if hub.process.returncode is not None else f"not listening after {startup_timeout}s"
+            print(f"[Starlight] ERROR: Hub {reason}.")
+            logs.dump("Hub")
+            return False
+        hub_listening = time.monotonic() - started
+        print(f"  [*] Hub listening on port {port} ({hub_listening:.2f}s)")
         
-        # 2. Launch Sentinels (unless --no-sentinels)
+        # 2. Launch Sentinels (unless --no-sentinels), all at once
+        sentinels = []
         if not no_sentinels:
             sentinels_dir = os.path.join(os.getcwd(), "sentinels")
             sentinel_files = discover_sentinels(sentinels_dir)
@@ -96,19 +227,16 @@ def execute(intent: str = None, no_sentinels: bool = False):
             for sentinel_path in sentinel_files:
                 sentinel_name = os.path.basename(sentinel_path)
                 print(f"  [+] Starting Sentinel: {sentinel_name}...")
-                
-                if sys.platform == "win32":
-                    sentinel_process = subprocess.Popen(
-                        ["python", sentinel_path],
-                        creationflags=subprocess.CREATE_NEW_CONSOLE
-                    )
-                else:
-                    sentinel_process = subprocess.Popen(
-                        ["python", sentinel_path],
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                    )
-                processes.append((sentinel_name, sentinel_process))
-                time.sleep(1)  # Stagger sentinel launches
+                sentinels.append(await supervisor.start(sentinel_name, ["python", sentinel_path],
+                                                        restart=restart_sentinels))
+
+        # Wait for every sentinel's registration (and the browser) instead of fixed sleeps
+        startup = await wait_for_constellation(port, sentinels, deadline, started, use_ssl)
+        print_startup_report(hub_listening, startup, time.monotonic() - started)
+        if not startup["complete"]:
+            print(f"[Starlight] WARNING: Constellation not fully up after {startup_timeout}s "
+                  f"({len(startup['layers'])}/{len(sentinels)} sentinels registered, "
+                  f"browser {'ready' if startup['ready'] is not None else 'not ready'}).")
         
         # 3. Run Intent (if provided)
         if intent:
@@ -117,30 +245,26 @@ def execute(intent: str = None, no_sentinels: bool = False):
                 print(f"[Starlight] ERROR: Intent script not found: {intent}")
             else:
                 print(f"  [+] Executing Intent: {intent}...")
-                time.sleep(2)  # Wait for Sentinels to register
-                subprocess.run(["node", intent_path])
+                # The intent shares our console; only the constellation's pipes are multiplexed
+                intent_process = await asyncio.create_subprocess_exec("node", intent_path)
+                await intent_process.wait()
         
         # If no intent, keep constellation running
         if not intent:
             print("\n[Starlight] Constellation is running. Press Ctrl+C to stop.")
-            try:
-                while True:
-                    time.sleep(1)
-                    # Check if Hub is still running
-                    if hub_process.poll() is not None:
-                        print("[Starlight] Hub has stopped.")
-                        break
-            except KeyboardInterrupt:
-                print("\n[Starlight] Shutting down constellation...")
+            await hub.done.wait()
+            print("[Starlight] Hub has stopped.")
         
+    except asyncio.CancelledError:
+        print("\n[Starlight] Shutting down constellation...")
+        raise
     except Exception as e:
         print(f"[Starlight] ERROR: {e}")
     finally:
         # Cleanup: terminate all processes
-        for name, proc in processes:
-            if proc.poll() is None:
-                proc.terminate()
-                print(f"  [-] Stopped: {name}")
+        print(supervisor.status_table())
+        await supervisor.stop()
+        await logs.close()
     
     print("[Starlight] Constellation stopped.")
     return True
@@ -58,6 +58,9 @@ Plugin Management:
     run_parser = subparsers.add_parser("run", help="Launch the constellation")
     run_parser.add_argument("--intent", "-i", help="Path to intent script to execute")
     run_parser.add_argument("--no-sentinels", action="store_true", help="Start Hub only")
+    run_parser.add_argument("--startup-timeout", type=float, default=30,
+                            help="Seconds to wait for the Hub and Sentinel registrations (default: 30)")
+    run_parser.add_argument("--log-dir", help="Also write each component's output to rotated log files here")
     
     # doctor command
     subparsers.add_parser("doctor", help="Validate development environment")
@@ -89,7 +92,8 @@ Plugin Management:
     elif args.command == "create":
         create_cmd.execute(args.name)
     elif args.command == "run":
-        run_cmd.execute(intent=args.intent, no_sentinels=args.no_sentinels)
+        run_cmd.execute(intent=args.intent, no_sentinels=args.no_sentinels, startup_timeout=args.startup_timeout,
+                        log_dir=args.log_dir)
     elif args.command == "doctor":
         doctor_cmd.execute()
     elif args.command == "triage":
@@ -0,0 +1,372 @@
+"""
+Starlight CLI - Constellation Supervisor
+Keeps the child processes (Hub, Sentinels) running and their output flowing.
+
+LogMultiplexer drains every child's pipes concurrently. Each line is echoed
+with the component's name, kept in a per-component ring buffer for post-mortems
+and optionally written to a rotated log file. Children never block on a full
+pipe, however chatty they are: console output is rate limited per component,
+and lines over the limit are counted rather than printed.
+
+ProcessSupervisor notices a child exiting right away, restarts sentinels with
+backoff, samples CPU and RSS from /proc (Linux) and restarts children that
+exceed a memory cap.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import os
+import sys
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """Allows `rate` events per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LogMultiplexer:
+    def __init__(self, log_dir=None, max_bytes=1048576, backups=3, ring_lines=500,
+                 rate_limit=50, burst=200, out=None):
+        """`rate_limit` is console lines per second per component (0 = unlimited).
+
+        With `log_dir`, every line also goes to <log_dir>/<component>.log, rotated at `max_bytes`.
+        """
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.ring_lines = ring_lines
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.out = out or sys.stdout
+        self.rings = {}  # name -> deque of recent lines
+        self.suppressed = {}  # name -> lines dropped from the console since the last notice
+        self._buckets = {}
+        self._loggers = {}
+        self._tasks = []
+        self._drains = {}  # name -> drain tasks of the latest attached process
+        self._width = 12
+
+    def attach(self, name, process):
+        """Start draining `process`'s stdout/stderr (asyncio subprocess with PIPEs)."""
+        self.rings.setdefault(name, deque(maxlen=self.ring_lines))
+        self.suppressed.setdefault(name, 0)
+        if self.rate_limit:
+            self._buckets[name] = TokenBucket(self.rate_limit, self.burst)
+        if self.log_dir and name not in self._loggers:
+            self._loggers[name] = self._open_log(name)
+        self._width = max(self._width, len(name))
+        tasks = [asyncio.ensure_future(self._drain(name, stream, is_err))
+                 for stream, is_err in ((process.stdout, False), (process.stderr, True)) if stream is not None]
+        self._tasks.extend(tasks)
+        self._drains[name] = tasks
+        return tasks
+
+    async def drained(self, name, timeout=1):
+        """Wait briefly until the last attached process of `name` has been read to EOF."""
+        tasks = self._drains.get(name)
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def mark(self, name, text):
+        """Write a separator into a component's ring and log file, not the console."""
+        self.rings.setdefault(name, deque(maxlen=self.ring_lines)).append(text)
+        logger = self._loggers.get(name)
+        if logger:
+            logger.info(text)
+
+    def _open_log(self, name):
+        os.makedirs(self.log_dir, exist_ok=True)
+        logger = logging.getLogger(f"starlight.constellation.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(self.log_dir, f"{name}.log"), maxBytes=self.max_bytes,
+            backupCount=self.backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        return logger
+
+    async def _drain(self, name, stream, is_err):
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:
+                # Line longer than the stream limit: take what is buffered
+                raw = await stream.read(65536)
+            if not raw:
+                break
+            self.emit(name, raw.decode("utf-8", "replace").rstrip("\r\n"), is_err)
+
+    def emit(self, name, line, is_err=False):
+        text = f"! {line}" if is_err else line
+        self.rings.setdefault(name, deque(maxlen=self.ring_lines)).append(text)
+        logger = self._loggers.get(name)
+        if logger:
+            logger.info(text)
+        bucket = self._buckets.get(name)
+        if bucket and not bucket.take():
+            self.suppressed[name] = self.suppressed.get(name, 0) + 1
+            return
+        dropped = self.suppressed.get(name, 0)
+        if dropped:
+            self.suppressed[name] = 0
+            self._print(name, f"... {dropped} lines suppressed (rate limit)")
+        self._print(name, text)
+
+    def _print(self, name, text):
+        try:
+            self.out.write(f"{name:<{self._width}} | {text}\n")
+            self.out.flush()
+        except (OSError, ValueError):
+            pass
+
+    def tail(self, name, lines=50):
+        """Most recent output of a component, oldest first."""
+        ring = self.rings.get(name, ())
+        return list(ring)[-lines:]
+
+    def dump(self, name, lines=50):
+        """Print a component's recent output (post-mortem after a crash)."""
+        recent = self.tail(name, lines)
+        if not recent:
+            print(f"  [*] {name} printed nothing.")
+            return
+        print(f"  [*] Last {len(recent)} lines from {name}:")
+        for text in recent:
+            print(f"      {text}")
+
+    async def close(self, timeout=2):
+        """Wait briefly for pipes to reach EOF, then close the log files."""
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+        for name, dropped in self.suppressed.items():
+            if dropped:
+                self._print(name, f"... {dropped} lines suppressed (rate limit)")
+                self.suppressed[name] = 0
+        for logger in self._loggers.values():
+            for handler in list(logger.handlers):
+                handler.close()
+                logger.removeHandler(handler)
+        self._loggers = {}
+
+
+_PROC_STATS = sys.platform.startswith("linux")
+if _PROC_STATS:
+    _CLK_TCK = os.sysconf("SC_CLK_TCK")
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def read_proc_stats(pid):
+    """(cpu_seconds, rss_bytes) of one process from /proc, or None if unavailable.
+
+    Only the process itself is counted, not its children (e.g. the Hub's browser).
+    """
+    if not _PROC_STATS:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces: fields start after its closing parenthesis
+    fields = data[data.rindex(")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / _CLK_TCK  # utime + stime
+    return cpu, int(fields[21]) * _PAGE_SIZE  # rss pages
+
+
+class Child:
+    """One supervised process and its restart history."""
+
+    def __init__(self, name, args, restart, memory_limit):
+        self.name = name
+        self.args = args
+        self.restart = restart
+        self.memory_limit = memory_limit  # bytes, or None
+        self.process = None
+        self.state = "starting"  # running, restarting, exited, failed, stopped
+        self.started_at = None
+        self.restarts = 0
+        self.quick_failures = 0  # Consecutive exits before the process counted as stable
+        self.last_exit = None
+        self.kill_reason = None  # Set when the supervisor itself stops the process
+        self.cpu_percent = None
+        self.rss = None
+        self._cpu_sample = None  # (monotonic time, cpu seconds)
+        self.done = asyncio.Event()  # Set once the child has stopped for good
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+
+class ProcessSupervisor:
+    """Restarts crashed children with backoff and watches their CPU and memory.
+
+    Exits are noticed as soon as the process is reaped, not on a polling tick.
+    A child that keeps dying within `stable_seconds` of starting backs off
+    exponentially and is given up after `max_restarts` such exits in a row.
+    """
+
+    def __init__(self, launch, logs=None, backoff=0.5, max_backoff=30, max_restarts=5, stable_seconds=30,
+                 sample_interval=1.0, memory_limit_mb=None, memory_limits=None):
+        """`launch(name, args)` is a coroutine returning an asyncio subprocess.
+
+        `memory_limit_mb` caps the RSS of every restartable child; `memory_limits` maps names to
+        their own cap in MB. Children started with `restart=False` (the Hub) are only capped by
+        an explicit `memory_limits` entry, since a kill would take them down for good.
+        """
+        self.launch = launch
+        self.logs = logs
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_restarts = max_restarts
+        self.stable_seconds = stable_seconds
+        self.sample_interval = sample_interval
+        self.memory_limit_mb = memory_limit_mb
+        self.memory_limits = memory_limits or {}
+        self.children = {}
+        self._tasks = []
+        self._sampler = None
+        self._stopping = False
+
+    def get(self, name):
+        return self.children.get(name)
+
+    async def start(self, name, args, restart=True):
+        """Launch a child and supervise it. `restart=False` children (the Hub) stay down when they exit."""
+        limit_mb = self.memory_limits.get(name, self.memory_limit_mb if restart else None)
+        child = Child(name, args, restart, limit_mb * 1024 * 1024 if limit_mb else None)
+        self.children[name] = child
+        await self._spawn(child)
+        self._tasks.append(asyncio.ensure_future(self._watch(child)))
+        if self._sampler is None and _PROC_STATS and self.sample_interval > 0:
+            self._sampler = asyncio.ensure_future(self._sample_loop())
+        return child
+
+    async def _spawn(self, child):
+        child.process = await self.launch(child.name, child.args)
+        child.state = "running"
+        child.started_at = time.monotonic()
+        child.kill_reason = None
+        child.cpu_percent = child.rss = child._cpu_sample = None
+
+    async def _watch(self, child):
+        while True:
+            code = await child.process.wait()
+            if self._stopping:
+                break
+            uptime = time.monotonic() - child.started_at
+            reason = child.kill_reason or f"exit code {code}"
+            child.last_exit = reason
+            print(f"[Starlight] {child.name} stopped ({reason}) after {uptime:.1f}s")
+            if self.logs:
+                await self.logs.drained(child.name)  # Its last lines may still be in the pipe
+            if self.logs and not child.kill_reason:
+                self.logs.dump(child.name, 20)
+            if not child.restart:
+                child.state = "exited"
+                break
+            child.quick_failures = 0 if uptime >= self.stable_seconds else child.quick_failures + 1
+            if self.max_restarts and child.quick_failures > self.max_restarts:
+                child.state = "failed"
+                print(f"[Starlight] Giving up on {child.name}: {child.quick_failures} failed starts in a row")
+                break
+            delay = min(self.max_backoff, self.backoff * 2 ** max(0, child.quick_failures - 1))
+            child.state = "restarting"
+            if self.logs:
+                # Keep post-mortem dumps from running several lives together
+                self.logs.mark(child.name, f"--- restart {child.restarts + 1} ({reason}) ---")
+            print(f"[Starlight] Restarting {child.name} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            if self._stopping:
+                break
+            try:
+                await self._spawn(child)
+            except Exception as e:
+                child.state = "failed"
+                print(f"[Starlight] Could not restart {child.name}: {e}")
+                break
+            child.restarts += 1
+        child.done.set()
+
+    async def _sample_loop(self):
+        while not self._stopping:
+            now = time.monotonic()
+            for child in list(self.children.values()):
+                if child.state != "running" or child.process.returncode is not None:
+                    continue
+                stats = read_proc_stats(child.pid)
+                if stats is None:
+                    continue
+                cpu, child.rss = stats
+                if child._cpu_sample is not None:
+                    then, cpu_then = child._cpu_sample
+                    child.cpu_percent = 100.0 * (cpu - cpu_then) / max(1e-6, now - then)
+                child._cpu_sample = (now, cpu)
+                if child.memory_limit and child.rss > child.memory_limit and not child.kill_reason:
+                    child.kill_reason = f"memory cap: {child.rss / 1048576:.0f} MB > {child.memory_limit / 1048576:.0f} MB"
+                    print(f"[Starlight] {child.name} over {child.kill_reason}, restarting")
+                    asyncio.ensure_future(self._terminate(child.process))
+            await asyncio.sleep(self.sample_interval)
+
+    @staticmethod
+    async def _terminate(process, grace=5):
+        if process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+        except asyncio.TimeoutError:
+            process.kill()
+
+    def status_table(self):
+        """One line per child: state, uptime, restarts, CPU and RSS."""
+        width = max([len(name) for name in self.children] + [9])
+        lines = [f"{'COMPONENT':<{width}}  {'PID':>7}  {'STATE':<10}  {'UPTIME':>8}  {'RESTARTS':>8}  "
+                 f"{'CPU%':>6}  {'RSS MB':>7}  LAST EXIT"]
+        now = time.monotonic()
+        for name, child in self.children.items():
+            running = child.state == "running"
+            uptime = f"{now - child.started_at:.0f}s" if running and child.started_at else "-"
+            cpu = f"{child.cpu_percent:.1f}" if running and child.cpu_percent is not None else "-"
+            rss = f"{child.rss / 1048576:.1f}" if running and child.rss is not None else "-"
+            pid = child.pid if running else "-"
+            lines.append(f"{name:<{width}}  {pid:>7}  {child.state:<10}  {uptime:>8}  {child.restarts:>8}  "
+                         f"{cpu:>6}  {rss:>7}  {child.last_exit or '-'}")
+        return "\n".join(lines)
+
+    async def stop(self):
+        """Stop supervising and terminate every child."""
+        self._stopping = True
+        if self._sampler is not None:
+            self._sampler.cancel()
+        for task in self._tasks:
+            task.cancel()
+        running = [c for c in self.children.values() if c.process and c.process.returncode is None]
+        for child in running:
+            print(f"  [-] Stopped: {child.name}")
+        await asyncio.gather(*(self._terminate(c.process) for c in running), return_exceptions=True)
+        for child in self.children.values():
+            if child.state in ("running", "restarting", "starting"):
+                child.state = "stopped"
+            child.done.set()
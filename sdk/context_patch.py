@@ -0,0 +1,66 @@
+"""
+Starlight Context Patch
+Applies the Hub's JSON-Patch style context deltas to a local replica.
+
+Each op is {"op": "add" | "replace" | "remove", "path": JSON Pointer, "value"}.
+The Hub diffs plain objects key by key, so only "add", "replace" and "remove" on
+object members are produced; array indices are still accepted for completeness.
+"""
+
+
+class PatchError(ValueError):
+    """An op does not apply to the replica, which means it has drifted from the Hub."""
+
+
+def parse_pointer(path):
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise PatchError(f"Invalid pointer: {path!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _resolve(doc, tokens, path):
+    for token in tokens:
+        if isinstance(doc, dict) and token in doc:
+            doc = doc[token]
+        elif isinstance(doc, list) and token.isdigit() and int(token) < len(doc):
+            doc = doc[int(token)]
+        else:
+            raise PatchError(f"Path not found: {path}")
+    return doc
+
+
+def apply_ops(doc, ops):
+    """Apply `ops` to `doc` in place. Raises PatchError if an op does not fit."""
+    for op in ops:
+        kind, path = op.get("op"), op.get("path", "")
+        tokens = parse_pointer(path)
+        if not tokens:
+            raise PatchError("Ops on the document root are not supported")
+        parent = _resolve(doc, tokens[:-1], path)
+        key = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if key == "-" else int(key) if key.isdigit() else -1
+            if not 0 <= index <= len(parent) - (kind != "add"):
+                raise PatchError(f"Index out of range: {path}")
+            if kind == "add":
+                parent.insert(index, op.get("value"))
+            elif kind == "replace":
+                parent[index] = op.get("value")
+            elif kind == "remove":
+                del parent[index]
+            else:
+                raise PatchError(f"Unsupported op: {kind!r}")
+        elif isinstance(parent, dict):
+            if kind in ("replace", "remove") and key not in parent:
+                raise PatchError(f"Path not found: {path}")
+            if kind in ("add", "replace"):
+                parent[key] = op.get("value")
+            elif kind == "remove":
+                del parent[key]
+            else:
+                raise PatchError(f"Unsupported op: {kind!r}")
+        else:
+            raise PatchError(f"Cannot index into a scalar: {path}")
+    return doc
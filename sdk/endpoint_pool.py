@@ -0,0 +1,162 @@
+"""
+Starlight Endpoint Pool
+Load balancing across several inference backends with health checks and circuit breakers.
+
+Requests go to the healthy endpoint with the fewest outstanding requests.
+Passive checks watch every call: repeated failures or slow answers open an
+endpoint's circuit so traffic routes around it. After a cooldown one trial
+request (half-open) decides whether it closes again. An optional active
+checker probes every endpoint in the background.
+"""
+
+import asyncio
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoHealthyEndpoint(Exception):
+    """Raised when every endpoint's circuit is open and none is due for a trial."""
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.state = CLOSED
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.requests = 0
+        self.failures = 0
+        self.latency_ewma = None  # Milliseconds
+        self.latency_max = 0.0
+
+    def record_latency(self, latency_ms, alpha=0.2):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency_ms
+        else:
+            self.latency_ewma = alpha * latency_ms + (1 - alpha) * self.latency_ewma
+        self.latency_max = max(self.latency_max, latency_ms)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latencyEwmaMs": round(self.latency_ewma, 1) if self.latency_ewma is not None else None,
+            "latencyMaxMs": round(self.latency_max, 1)
+        }
+
+
+class EndpointPool:
+    """Least-outstanding-requests balancer with per-endpoint circuit breakers."""
+
+    def __init__(self, urls, failure_threshold=3, cooldown=10.0, slow_ms=None):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.slow_ms = slow_ms  # Answers slower than this count as failures
+        self._health_task = None
+
+    def _available(self, now):
+        available = []
+        for ep in self.endpoints:
+            if ep.state == OPEN and now - ep.opened_at >= self.cooldown:
+                ep.state = HALF_OPEN
+            if ep.state == CLOSED or (ep.state == HALF_OPEN and not ep.trial_in_flight):
+                available.append(ep)
+        return available
+
+    def acquire(self, exclude=()):
+        """Pick an endpoint and count the request against it. Pair with release()."""
+        candidates = [ep for ep in self._available(time.monotonic()) if ep not in exclude]
+        if not candidates:
+            raise NoHealthyEndpoint("All inference endpoints are unavailable")
+        ep = min(candidates, key=lambda e: (e.outstanding, e.latency_ewma or 0.0))
+        if ep.state == HALF_OPEN:
+            ep.trial_in_flight = True
+        ep.outstanding += 1
+        ep.requests += 1
+        return ep
+
+    def release(self, ep, ok, latency_ms=None):
+        """Passive health check: record the outcome of a request to `ep`.
+
+        `ok=None` means the request was abandoned (e.g. cancelled) and says nothing about health.
+        """
+        ep.outstanding -= 1
+        ep.trial_in_flight = False
+        if ok is None:
+            return
+        if latency_ms is not None:
+            ep.record_latency(latency_ms)
+            if ok and self.slow_ms and latency_ms > self.slow_ms:
+                ok = False
+        if ok:
+            self._close(ep)
+        else:
+            ep.failures += 1
+            ep.consecutive_failures += 1
+            if ep.state == HALF_OPEN or ep.consecutive_failures >= self.failure_threshold:
+                self._open(ep)
+
+    def _open(self, ep):
+        if ep.state != OPEN:
+            print(f"[EndpointPool] Circuit OPEN for {ep.url} ({ep.consecutive_failures} consecutive failures)")
+        ep.state = OPEN
+        ep.opened_at = time.monotonic()
+
+    def _close(self, ep):
+        if ep.state != CLOSED:
+            print(f"[EndpointPool] Circuit CLOSED for {ep.url}")
+        ep.state = CLOSED
+        ep.consecutive_failures = 0
+
+    # --- Active health checks ---
+
+    def start_health_checks(self, client, path, interval):
+        """Probe every endpoint's `path` every `interval` seconds using an httpx.AsyncClient."""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop(client, path, interval))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    @staticmethod
+    def url_with_path(url, path):
+        parts = urlsplit(url)
+        return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+    async def _probe(self, client, ep, path):
+        try:
+            response = await client.get(self.url_with_path(ep.url, path), timeout=2.0)
+            healthy = response.status_code < 500
+        except Exception:
+            healthy = False
+        if healthy and ep.state == OPEN:
+            # Reachable again: allow a trial request to decide whether the circuit closes
+            ep.state = HALF_OPEN
+        elif not healthy:
+            ep.consecutive_failures += 1
+            self._open(ep)
+
+    async def _health_loop(self, client, path, interval):
+        while True:
+            await asyncio.gather(*(self._probe(client, ep, path) for ep in self.endpoints))
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {ep.url: ep.stats() for ep in self.endpoints}
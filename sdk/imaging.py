@@ -0,0 +1,69 @@
+"""
+Starlight Imaging Helpers
+Screenshot preprocessing for vision inference: downscaling and region-of-interest cropping.
+
+Inference latency grows with image size, so screenshots are shrunk to a maximum
+edge and, optionally, cropped to the area around the blocking elements before
+they are sent to the model. Pillow is optional: without it, screenshots pass
+through unchanged.
+"""
+
+import base64
+import io
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: preprocessing becomes a no-op
+    Image = None
+
+
+def union_bounds(elements):
+    """Return the (left, top, right, bottom) union of blocking elements' bounds, or None."""
+    box = None
+    for element in elements or []:
+        bounds = element.get("bounds")
+        if not isinstance(bounds, dict):
+            continue
+        try:
+            left, top = float(bounds["x"]), float(bounds["y"])
+            right, bottom = left + float(bounds["width"]), top + float(bounds["height"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if box is None:
+            box = [left, top, right, bottom]
+        else:
+            box = [min(box[0], left), min(box[1], top), max(box[2], right), max(box[3], bottom)]
+    return tuple(box) if box else None
+
+
+def preprocess_screenshot(screenshot_b64, max_edge=768, roi=None, margin=32, quality=75):
+    """Downscale a base64 screenshot to `max_edge` and optionally crop it to `roi`.
+
+    `roi` is a (left, top, right, bottom) box in screenshot pixels, padded by `margin`.
+    Returns the original string untouched when nothing would change.
+    """
+    if Image is None:
+        return screenshot_b64
+
+    img = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+    changed = False
+
+    if roi:
+        left = max(0, int(roi[0] - margin))
+        top = max(0, int(roi[1] - margin))
+        right = min(img.width, int(roi[2] + margin))
+        bottom = min(img.height, int(roi[3] + margin))
+        if right > left and bottom > top and (right - left, bottom - top) != img.size:
+            img = img.crop((left, top, right, bottom))
+            changed = True
+
+    if max_edge and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge))
+        changed = True
+
+    if not changed:
+        return screenshot_b64
+
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="JPEG", quality=quality)
+    return base64.b64encode(out.getvalue()).decode("ascii")
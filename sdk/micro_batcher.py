@@ -0,0 +1,77 @@
+"""
+Starlight Micro-Batcher
+Collects concurrent requests for a short window and hands them to a handler as one batch.
+
+Callers `await submit(item)` as if it were a single call. Items arriving within
+`window` seconds of the first one (or until `max_batch` items are queued) are
+passed together to `handler(items)`, which must return one result per item in
+order. Each result is then delivered to its own caller. This trades at most one
+window of extra latency for fewer, larger backend calls.
+"""
+
+import asyncio
+
+
+class MicroBatcher:
+    def __init__(self, handler, window=0.005, max_batch=8):
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []  # [(item, future)]
+        self._timer = None
+        self.stats = {"batches": 0, "items": 0, "maxBatch": 0}
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Not sent yet: drop the item so the backend never sees it
+            self._pending = [p for p in self._pending if p[1] is not future]
+            raise
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["maxBatch"] = max(self.stats["maxBatch"], len(batch))
+        task = asyncio.ensure_future(self._run(batch))
+        for _, future in batch:
+            future.add_done_callback(lambda _f, b=batch, t=task: self._abandon_if_unwanted(b, t))
+
+    async def _run(self, batch):
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _abandon_if_unwanted(batch, task):
+        """Cancel the backend call once every caller in the batch has gone away."""
+        if not task.done() and all(f.cancelled() for _, f in batch):
+            task.cancel()
+
+    @property
+    def avg_batch_size(self):
+        return self.stats["items"] / self.stats["batches"] if self.stats["batches"] else 0.0
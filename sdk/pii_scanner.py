@@ -0,0 +1,284 @@
+"""
+Starlight PII Scanner
+Single-pass multi-pattern matcher for PII detection.
+
+Patterns are compiled into one alternation of named groups, so text is scanned
+once however many patterns are configured. Patterns can also declare an anchor:
+a cheap regex for something every match must contain, such as "@" for email or
+a run of digits and separators for numeric identifiers. The anchor is found with
+a fast scan, and the combined regex only runs in small windows around the hits.
+Text without any "@" never pays for the email pattern.
+
+Each pattern finds what its own finditer would. The combined regex is
+leftmost-first, so where two patterns match overlapping text (an IP address
+running into an SSN) only the first listed wins; the span of every match is
+then searched again for the other patterns in its group. Patterns that cannot
+share a combined regex (numeric back-references, clashing group names) are
+scanned on their own.
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+
+DEFAULT_PATTERNS = {
+    "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    "ssn": r'\b\d{3}-\d{2}-\d{4}\b',
+    "credit_card": r'\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|6(?:011|5[0-9]{2})[0-9]{12})\b',
+    "phone_us": r'\b(?:\+1[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b',
+    "ip_address": r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
+    "date_of_birth": r'\b(?:0[1-9]|1[0-2])[/-](?:0[1-9]|[12]\d|3[01])[/-](?:19|20)\d{2}\b',
+}
+
+
+class Anchor:
+    """Locates the windows of text where a group of patterns can match.
+
+    Each hit of `regex` becomes the window [start - before, end + after]; every
+    match of the anchored patterns must lie inside one window. Keep one character
+    of `after` so word boundaries at the window end see the real next character.
+    """
+
+    def __init__(self, regex, before=0, after=1):
+        self.regex = re.compile(regex)
+        self.before = before
+        self.after = after
+
+    def windows(self, text):
+        """Yield merged (start, end) windows in text order."""
+        size = len(text)
+        current = None
+        for hit in self.regex.finditer(text):
+            lo, hi = max(0, hit.start() - self.before), min(size, hit.end() + self.after)
+            if current is not None and lo <= current[1]:
+                current[1] = max(current[1], hi)
+                continue
+            if current is not None:
+                yield current[0], current[1]
+            current = [lo, hi]
+        if current is not None:
+            yield current[0], current[1]
+
+
+# "@" plus the domain; the local part (at most 64 characters) lies before it
+EMAIL_ANCHOR = Anchor(r"@[\w.-]*", before=64)
+# A digit followed by digits and the separators numeric identifiers use ("+" / "(" may precede it)
+NUMERIC_ANCHOR = Anchor(r"\d[\d()+./\s-]*", before=1)
+
+DEFAULT_ANCHORS = {
+    "email": EMAIL_ANCHOR,
+    "ssn": NUMERIC_ANCHOR,
+    "credit_card": NUMERIC_ANCHOR,
+    "phone_us": NUMERIC_ANCHOR,
+    "ip_address": NUMERIC_ANCHOR,
+    "date_of_birth": NUMERIC_ANCHOR,
+}
+
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class PIIScanner:
+    def __init__(self, patterns, anchors=None, flags=re.IGNORECASE):
+        """`patterns` maps a PII type to a regex string; invalid ones are skipped and listed in `errors`.
+
+        `anchors` maps a PII type to an Anchor. Only give anchors for patterns they were written for.
+        """
+        self.flags = flags
+        self.errors = {}
+        self.patterns = {}
+        for name, pattern in patterns.items():
+            try:
+                re.compile(pattern, flags)
+            except re.error as e:
+                self.errors[name] = str(e)
+                continue
+            self.patterns[name] = pattern
+
+        # Group patterns by anchor (None = scan the full text), one combined regex per group
+        self.compiled = {name: re.compile(pattern, flags) for name, pattern in self.patterns.items()}
+        self.groups = []  # [(anchor, compiled, {group: name})]
+        self.separate = {}  # name -> (anchor, compiled), for patterns that cannot join a combined regex
+        members = {}
+        for name, pattern in self.patterns.items():
+            anchor = (anchors or {}).get(name)
+            names = members.setdefault(anchor, [])
+            if _BACKREF.search(pattern) or not self._try_combine(names + [name]):
+                self.separate[name] = (anchor, self.compiled[name])
+            else:
+                names.append(name)
+        for anchor, names in members.items():
+            if names:
+                self.groups.append((anchor, *self._build(names)))
+
+    def _build(self, names):
+        groups = {f"_p{i}": name for i, name in enumerate(names)}
+        source = "|".join(f"(?P<{group}>{self.patterns[name]})" for group, name in groups.items())
+        return re.compile(source, self.flags), groups
+
+    def _try_combine(self, names):
+        try:
+            self._build(names)
+            return True
+        except re.error:
+            return False
+
+    @staticmethod
+    def _spans(anchor, text):
+        if anchor is None:
+            return ((0, len(text)),)
+        return anchor.windows(text)
+
+    def finditer(self, text):
+        """Yield (pii_type, start, end, value) for each match in `text`, grouped by anchor."""
+        for anchor, regex, groups in self.groups:
+            names = list(groups.values())
+            for lo, hi in self._spans(anchor, text):
+                resume = dict.fromkeys(names, lo)  # Where each pattern's own scan would carry on
+                for match in regex.finditer(text, lo, hi):
+                    # A pattern's own inner groups close before its wrapper, so lastgroup is always the wrapper
+                    winner = groups[match.lastgroup]
+                    for name in names:
+                        if name == winner:
+                            if match.start() >= resume[name]:
+                                resume[name] = match.end()
+                                yield name, match.start(), match.end(), match.group(0)
+                            continue
+                        # Matches of the losing patterns that start inside the winner's span
+                        pos = max(match.start(), resume[name])
+                        while pos < match.end():
+                            found = self.compiled[name].search(text, pos, hi)
+                            if not found or found.start() >= match.end():
+                                break
+                            yield name, found.start(), found.end(), found.group(0)
+                            pos = resume[name] = max(found.end(), found.start() + 1)
+        for name, (anchor, pattern) in self.separate.items():
+            for lo, hi in self._spans(anchor, text):
+                for match in pattern.finditer(text, lo, hi):
+                    yield name, match.start(), match.end(), match.group(0)
+
+
+class IncrementalScanner:
+    """Content-addressed chunk cache in front of a PIIScanner.
+
+    Text is cut into chunks at line ends chosen by the content of the line
+    itself, so inserting or removing a line only changes the chunks around it.
+    Each chunk is hashed and its findings cached; only new or changed chunks are
+    rescanned. Matches that cross a chunk boundary (e.g. a phone number wrapped
+    onto the next line) are found by scanning a short junction window around each
+    boundary, which is cached the same way.
+
+    The cache is bounded by the characters its entries cover, not their count,
+    so its capacity does not depend on chunk sizes. A text that could not fit
+    alongside the previous version of itself is scanned directly instead: an
+    LRU cache smaller than the working set only ever misses.
+    """
+
+    def __init__(self, scanner, min_chunk=1024, max_chunk=8192, boundary_mask=7, junction=128, max_bytes=32 << 20):
+        self.scanner = scanner
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.boundary_mask = boundary_mask  # Cut after ~1 in (mask + 1) lines once min_chunk is reached
+        self.junction = junction  # Characters scanned on each side of a boundary
+        self.max_bytes = max_bytes  # Characters covered by cached entries
+        self.cache = OrderedDict()  # digest -> (covered characters, ((pii_type, start, end, value), ...))
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def chunk_bounds(self, text):
+        """Yield the end offset of every chunk."""
+        start = pos = 0
+        candidates = 0  # Lines past min_chunk that did not cut
+        size = len(text)
+        while start < size:
+            # Lines ending before min_chunk can never close the chunk, so skip straight past them
+            newline = text.find("\n", max(pos, start + self.min_chunk - 1), start + self.max_chunk)
+            if newline == -1:
+                if start + self.max_chunk >= size:
+                    yield size
+                    break
+                # No line end within max_chunk: cut after the last space instead
+                cut = text.rfind(" ", start + self.min_chunk, start + self.max_chunk)
+                cut = start + self.max_chunk if cut == -1 else cut + 1
+                yield cut
+                start = pos = cut
+                candidates = 0
+                continue
+            line_end = newline + 1
+            line_start = max(start, text.rfind("\n", start, newline) + 1)
+            candidates += 1
+            # Repetitive short lines may never hash to a cut: bound the per-chunk line walk
+            if hash(text[line_start:line_end]) & self.boundary_mask == 0 or candidates >= 4 * (self.boundary_mask + 1):
+                yield line_end
+                start = line_end
+                candidates = 0
+            pos = line_end
+
+    def _scan_cached(self, piece):
+        key = hashlib.blake2b(piece.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        found = tuple(self.scanner.finditer(piece))
+        self.cache[key] = (len(piece), found)
+        self.cached_bytes += len(piece)
+        while self.cached_bytes > self.max_bytes:
+            self.cached_bytes -= self.cache.popitem(last=False)[1][0]
+        return found
+
+    def _straddling(self, text, boundary):
+        """Matches crossing `boundary`, found in a short window around it."""
+        lo = max(0, boundary - self.junction)
+        window = text[lo:boundary + self.junction]
+        found = []
+        for pii_type, s, e, value in self._scan_cached(window):
+            # Only matches that cross the boundary and are not cut off by the window edges
+            if s < boundary - lo < e and (s > 0 or lo == 0) and (e < len(window) or lo + e == len(text)):
+                found.append((pii_type, lo + s, lo + e, value))
+        return found
+
+    def iter_scan(self, text):
+        """Yield (pii_type, start, end, value) chunk by chunk, so callers can stop early.
+
+        Only one chunk (plus its junction windows) is copied at a time.
+        """
+        if len(text) > self.max_bytes // 2:
+            # Chunks and junctions of this text and its last version would overflow the cache
+            self.bypassed += 1
+            yield from self.scanner.finditer(text)
+            return
+        start = 0
+        before = []  # Matches crossing the boundary at `start`
+        for end in self.chunk_bounds(text):
+            after = self._straddling(text, end) if end < len(text) else []
+            crossing = before + after
+            for pii_type, s, e, value in self._scan_cached(text[start:end]):
+                s, e = start + s, start + e
+                # A crossing match supersedes any partial match this chunk saw of it
+                if not any(s < x[2] and x[1] < e for x in crossing):
+                    yield pii_type, s, e, value
+            yield from after
+            before, start = after, end
+
+    def scan(self, text):
+        """Return (pii_type, start, end, value) for every match in `text`."""
+        return list(self.iter_scan(text))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.cache),
+            "bytes": self.cached_bytes,
+            "bypassed": self.bypassed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hit_rate, 3)
+        }
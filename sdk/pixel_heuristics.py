@@ -0,0 +1,130 @@
+"""
+Starlight Pixel Heuristics
+Fast first-stage obstacle classifier that runs on the decoded screenshot before any model call.
+
+Three cues cover most overlays:
+- dimmed backdrop: a dark, flat border ring around a much brighter centre
+- centred box: a strong rectangle of edges near the middle of the viewport
+- cookie bar: a full-width band along the bottom (or top) edge that differs from the page above it
+
+Each cue yields a score in [0, 1]. Strong scores give a confident obstacle verdict,
+uniformly weak scores give a confident "none", and anything in between is left
+to the vision model. NumPy and Pillow are optional: without them every screenshot
+is reported as undecided.
+"""
+
+import base64
+import io
+
+try:
+    import numpy as np
+except ImportError:  # Optional: every screenshot escalates to the model
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+EDGE_THRESHOLD = 24  # Luminance step (0-255) that counts as an edge
+
+
+def _ramp(value, low, high):
+    """0 at `low`, 1 at `high`, linear in between."""
+    return float(min(1.0, max(0.0, (value - low) / (high - low))))
+
+
+def load_luminance(screenshot_b64, width=256):
+    """Decode a base64 screenshot to a small float32 luminance array."""
+    img = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+    img.draft("L", (width * 2, width * 2))  # Let the JPEG decoder downscale cheaply
+    img = img.convert("L")
+    height = max(16, round(img.height * width / img.width))
+    return np.asarray(img.resize((width, height), Image.BILINEAR), dtype=np.float32)
+
+
+def backdrop_score(lum):
+    """A modal backdrop darkens everything around a bright dialog."""
+    h, w = lum.shape
+    bh, bw = max(1, h // 12), max(1, w // 12)
+    ring = np.concatenate([lum[:bh].ravel(), lum[-bh:].ravel(), lum[:, :bw].ravel(), lum[:, -bw:].ravel()])
+    centre = lum[int(h * 0.35):int(h * 0.65), int(w * 0.35):int(w * 0.65)]
+    contrast = float(centre.mean() - ring.mean())
+    return _ramp(contrast, 30, 90) * _ramp(140 - float(ring.mean()), 0, 50)
+
+
+def centred_box_score(lum):
+    """Look for two long horizontal and two long vertical edge lines framing a centred box."""
+    h, w = lum.shape
+    rows = (np.abs(np.diff(lum, axis=0)) > EDGE_THRESHOLD).sum(axis=1) / w  # Horizontal edge coverage per row
+    cols = (np.abs(np.diff(lum, axis=1)) > EDGE_THRESHOLD).sum(axis=0) / h  # Vertical edge coverage per column
+
+    def frame(profile, size):
+        # Strongest edge line in each half, so the pair brackets the centre
+        mid = size // 2
+        lo_band, hi_band = profile[int(size * 0.08):mid], profile[mid:int(size * 0.92)]
+        if not len(lo_band) or not len(hi_band):
+            return 0.0, 0, size
+        first = int(np.argmax(lo_band)) + int(size * 0.08)
+        second = int(np.argmax(hi_band)) + mid
+        return float(min(profile[first], profile[second])), first, second
+
+    row_strength, top, bottom = frame(rows, h - 1)
+    col_strength, left, right = frame(cols, w - 1)
+    if bottom - top < h * 0.15 or right - left < w * 0.15:
+        return 0.0
+
+    inside = lum[top + 1:bottom, left + 1:right]
+    outside_mask = np.ones(lum.shape, dtype=bool)
+    outside_mask[top:bottom + 1, left:right + 1] = False
+    if not inside.size or not outside_mask.any():
+        return 0.0
+    contrast = abs(float(inside.mean()) - float(lum[outside_mask].mean()))
+    # Coverage is relative to the whole image, so a box a third of the page wide scores ~0.33
+    return _ramp(min(row_strength, col_strength), 0.12, 0.3) * _ramp(contrast, 15, 60)
+
+
+def edge_bar_score(lum):
+    """A cookie/consent bar is a full-width band flush with the bottom or top edge."""
+    h, w = lum.shape
+    rows = (np.abs(np.diff(lum, axis=0)) > EDGE_THRESHOLD).sum(axis=1) / w
+    best = 0.0
+    min_bar, max_bar = max(2, int(h * 0.04)), int(h * 0.35)
+    for boundary in (h - 1 - np.arange(min_bar, max_bar)):  # Bottom bars
+        span = rows[boundary]
+        if span < 0.5:
+            continue
+        bar, above = lum[boundary + 1:], lum[max(0, boundary - (h - boundary)):boundary]
+        best = max(best, _ramp(span, 0.6, 0.9) * _ramp(abs(float(bar.mean()) - float(above.mean())), 15, 50))
+    for boundary in range(min_bar, max_bar):  # Top bars
+        span = rows[boundary]
+        if span < 0.5:
+            continue
+        bar, below = lum[:boundary + 1], lum[boundary + 1:boundary + 1 + boundary]
+        best = max(best, _ramp(span, 0.6, 0.9) * _ramp(abs(float(bar.mean()) - float(below.mean())), 15, 50))
+    return best
+
+
+def classify_screenshot(screenshot_b64, high=0.7, low=0.15):
+    """Return (decided, verdict, scores) for a base64 screenshot.
+
+    `decided` is False when the cues are ambiguous and the model should look.
+    `verdict` uses the vision keywords ("modal", "banner") or None for no obstacle.
+    """
+    if np is None or Image is None:
+        return False, None, {}
+
+    lum = load_luminance(screenshot_b64)
+    scores = {
+        "backdrop": round(backdrop_score(lum), 3),
+        "box": round(centred_box_score(lum), 3),
+        "bar": round(edge_bar_score(lum), 3)
+    }
+
+    if scores["backdrop"] >= high or (scores["box"] >= high and scores["backdrop"] >= low):
+        return True, "modal", scores
+    if scores["bar"] >= high and scores["box"] < low:
+        return True, "banner", scores
+    if max(scores.values()) < low:
+        return True, None, scores
+    return False, None, scores
@@ -0,0 +1,157 @@
+"""
+Starlight Screenshot Cache
+Perceptual-hash index so near-identical page states reuse a cached vision verdict.
+
+Screenshots are reduced to a 512-bit difference hash (dHash over a 16x16 grid,
+horizontal and vertical gradients) and stored in a BK-tree, which answers
+"closest hash within N bits" without scanning every entry.
+Pillow is optional: without it, an exact content hash is used instead, so only
+byte-identical screenshots hit the cache.
+"""
+
+import base64
+import hashlib
+import io
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: exact-match hashing only
+    Image = None
+
+
+def dhash(screenshot_b64, size=16):
+    """Return a 2*size*size-bit perceptual difference hash of a base64-encoded image.
+
+    Horizontal and vertical gradients are both hashed: a horizontal-only dHash
+    does not change at all when a full-width banner appears.
+    """
+    raw = base64.b64decode(screenshot_b64)
+    if Image is None:
+        return int(hashlib.sha1(raw).hexdigest(), 16)
+
+    img = Image.open(io.BytesIO(raw))
+    img.draft("L", (size * 16, size * 16))  # Let the JPEG decoder downscale cheaply
+    grid = size + 1
+    pixels = list(img.convert("L").resize((grid, grid), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            here = pixels[row * grid + col]
+            value = (value << 2) | ((here > pixels[row * grid + col + 1]) << 1) | (here > pixels[(row + 1) * grid + col])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes using Hamming distance."""
+
+    def __init__(self):
+        self.root = None  # [key, value, {distance: child}]
+        self.size = 0
+
+    def add(self, key, value):
+        node = [key, value, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            d = hamming(key, current[0])
+            if d == 0:
+                current[1] = value  # Same hash: replace in place
+                self.size -= 1
+                return
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def nearest(self, key, max_distance, accept=None):
+        """Return (distance, key, value) of the closest entry within max_distance, or None."""
+        best = None
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(key, node[0])
+            if d <= max_distance and (best is None or d < best[0]) and (accept is None or accept(node[1])):
+                best = (d, node[0], node[1])
+                if d == 0:
+                    break
+            limit = best[0] if best else max_distance
+            for child_d, child in node[2].items():
+                # Triangle inequality: only subtrees that can hold something closer
+                if d - limit <= child_d <= d + limit:
+                    stack.append(child)
+        return best
+
+    def items(self):
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            yield node[0], node[1]
+            stack.extend(node[2].values())
+
+
+class ScreenshotCache:
+    """Bounded, TTL-limited verdict cache keyed by perceptual hash."""
+
+    def __init__(self, max_distance=4, ttl=300.0, max_entries=256):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tree = BKTree()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, entry):
+        return time.monotonic() - entry["at"] <= self.ttl
+
+    def lookup(self, key):
+        """Return (found, verdict, distance) for the nearest fresh entry."""
+        match = self.tree.nearest(key, self.max_distance, accept=self._fresh)
+        if match is None:
+            self.misses += 1
+            return False, None, None
+        self.hits += 1
+        return True, match[2]["verdict"], match[0]
+
+    def invalidate(self, key, max_distance=None):
+        """Expire every entry within `max_distance` (default: the lookup radius) of `key`."""
+        radius = self.max_distance if max_distance is None else max_distance
+        expired = 0
+        for other, entry in self.tree.items():
+            if hamming(key, other) <= radius and self._fresh(entry):
+                entry["at"] = float("-inf")
+                expired += 1
+        return expired
+
+    def store(self, key, verdict):
+        self.tree.add(key, {"verdict": verdict, "at": time.monotonic()})
+        if self.tree.size > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        """Rebuild the tree from the newest live entries (BK-trees have no cheap delete)."""
+        live = sorted((e for e in self.tree.items() if self._fresh(e[1])), key=lambda e: e[1]["at"])
+        self.tree = BKTree()
+        for key, entry in live[-(self.max_entries // 2 or 1):]:
+            self.tree.add(key, entry)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": self.tree.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hit_rate, 3)
+        }
@@ -12,10 +12,14 @@ import time
 import os
 import sys
 import signal
+import re
 import tempfile
 import shutil
 from abc import ABC, abstractmethod
 
+from sdk.context_patch import apply_ops, PatchError
+from sdk.micro_batcher import MicroBatcher
+
 class SentinelBase(ABC):
     def __init__(self, layer_name, priority, uri=None):
         # Support HUB_URL environment variable for flexible Hub connection
@@ -29,12 +33,33 @@ class SentinelBase(ABC):
         self._running = False
         self.memory = {}
         self.last_action = None
+        self._watchers = []  # (predicate, future) pairs resolved by incoming events
+        self._last_entropy_at = 0.0  # monotonic time of the latest entropy frame
+        self.context = {}  # Local replica of the Hub's sovereign state, kept current by deltas
+        self._context_version = None  # Hub version the replica reflects; None until the first snapshot
+        self._context_syncing = False  # A full resync has been requested and not yet answered
         # Stability: Use absolute path in project root, not relative CWD
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.memory_file = os.path.join(project_root, f"{self.layer}_memory.json")
         
         # Load config
         self.config = self._load_config()
+        # Write-combining for update_context: merged updates go out once per window (0 = send each at once)
+        self.context_flush_window = self.config.get("sentinel", {}).get("contextFlushMs", 50) / 1000.0
+        self._context_buffer = {}
+        self._context_flush = None  # TimerHandle of the pending flush
+        self.context_stats = {"updates": 0, "frames": 0}
+        # starlight.query: batched DOM queries, answers cached per page version
+        query_cfg = self.config.get("sentinel", {}).get("query", {})
+        self.query_timeout = query_cfg.get("timeout", 2)
+        self._query_batcher = MicroBatcher(self._send_queries, query_cfg.get("windowMs", 2) / 1000.0,
+                                           query_cfg.get("maxBatch", 16))
+        self._queries = {}  # request id -> future of the Hub's reply
+        self._query_seq = 0
+        self._query_cache = {}  # (kind, selector, name) -> result for _query_version
+        self._query_version = -1
+        self._query_epoch = 0  # Bumped by mutation events, so replies in flight across them are not cached
+        self.query_stats = {"queries": 0, "cacheHits": 0, "frames": 0}
 
     def _load_config(self):
         """Load configuration from config.json."""
@@ -103,15 +128,20 @@ class SentinelBase(ABC):
                     # Start background tasks
                     heartbeat_task = asyncio.create_task(self._heartbeat_loop())
                     
-                    async for message in websocket:
+                    try:
+                        async for message in websocket:
+                            if not self._running:
+                                break
+                            try:
+                                data = json.loads(message)
+                                asyncio.create_task(self._handle_protocol(data))
+                            except json.JSONDecodeError as e:
+                                print(f"[{self.layer}] Warning: Received malformed JSON, ignoring: {e}")
+                                # Continue processing - don't crash on bad input
+                    finally:
                         if not self._running:
-                            break
-                        try:
-                            data = json.loads(message)
-                            asyncio.create_task(self._handle_protocol(data))
-                        except json.JSONDecodeError as e:
-                            print(f"[{self.layer}] Warning: Received malformed JSON, ignoring: {e}")
-                            # Continue processing - don't crash on bad input
+                            # Send buffered context updates while the connection is still open
+                            await self.flush()
                         
             except websockets.exceptions.ConnectionClosed as e:
                 print(f"[{self.layer}] Connection closed: {e}. Retrying in {reconnect_delay}s...")
@@ -125,6 +155,10 @@ class SentinelBase(ABC):
         
         # Final save on exit
         self._save_memory()
+        try:
+            await self.on_shutdown()
+        except Exception as e:
+            print(f"[{self.layer}] Warning: Shutdown hook failed: {e}")
         print(f"[{self.layer}] Shutdown complete.")
 
     async def _register(self):
@@ -139,11 +173,15 @@ class SentinelBase(ABC):
                 "priority": self.priority,
                 "selectors": self.selectors,
                 "capabilities": self.capabilities,
+                "contextDeltas": True,
                 "version": "1.0.0",
                 "authToken": auth_token
             },
             "id": "reg-" + str(int(time.time()))
         }
+        # The Hub answers with a fresh snapshot; deltas before it would not apply
+        self._context_version = None
+        self._context_syncing = True
         await self._websocket.send(json.dumps(msg))
 
     async def _heartbeat_loop(self):
@@ -170,24 +208,244 @@ class SentinelBase(ABC):
         msg_id = data.get("id")
 
         if method == "starlight.pre_check":
+            self._start_query_generation(params.get("pageVersion"))
             await self.on_pre_check(params, msg_id)
+        elif method == "starlight.query":
+            future = self._queries.pop(msg_id, None)
+            if future is not None and not future.done():
+                future.set_result(params)
         elif method == "starlight.entropy_stream":
+            self._observe_page_version(params.get("pageVersion"))
+            self._last_entropy_at = time.monotonic()
+            self._notify_watchers({"type": "entropy", **params})
             await self.on_entropy(params)
         elif method == "starlight.sovereign_update":
-            await self.on_context_update(params.get("context", {}))
+            self.context = params.get("context", {})
+            self._context_version = params.get("version")
+            self._context_syncing = False
+            await self.on_context_update(self.context)
+        elif method == "starlight.context_delta":
+            await self._apply_context_delta(params)
         else:
+            if not method and data.get("type") == "dom_mutation":
+                self._invalidate_queries()
+                self._notify_watchers(data)
             # Phase 7.3: For responses/broadcasts without method, pass full data
             await self.on_message(method, params if method else data, msg_id)
 
+    async def _apply_context_delta(self, params):
+        if self._context_syncing:
+            return  # The snapshot on its way already includes this change
+        if self._context_version is None or params.get("baseVersion") != self._context_version:
+            print(f"[{self.layer}] Context version gap ({self._context_version} -> {params.get('version')}), resyncing")
+            await self._request_context_sync()
+            return
+        ops = params.get("ops", [])
+        try:
+            apply_ops(self.context, ops)
+        except PatchError as e:
+            print(f"[{self.layer}] Context delta did not apply ({e}), resyncing")
+            await self._request_context_sync()
+            return
+        self._context_version = params.get("version")
+        await self.on_context_delta(ops, self._context_version)
+        await self.on_context_update(self.context)
+
+    async def _request_context_sync(self):
+        self._context_syncing = True
+        await self._send_msg("starlight.context_sync", {})
+
+    # --- DOM Queries ---
+
+    async def query(self, kind, selector=None, name=None):
+        """Ask the Hub a fact about the current page. Returns the value, or None on error/timeout.
+
+        Kinds: "title", "url", and for a selector "count", "visible", "text", "rect",
+        "rects" (of every visible match) and "attribute" (`name`). Shadow DOM is reached with "host >>> inner".
+        Queries issued together (e.g. via query_many or asyncio.gather) share one frame,
+        and answers are reused until the page changes.
+        """
+        key = (kind, selector, name)
+        self.query_stats["queries"] += 1
+        if key in self._query_cache:
+            self.query_stats["cacheHits"] += 1
+            return self._query_cache[key].get("value")
+        epoch = self._query_epoch
+        try:
+            result, page_version = await self._query_batcher.submit({"kind": kind, "selector": selector, "name": name})
+        except asyncio.TimeoutError:
+            print(f"[{self.layer}] Query timed out: {kind} {selector or ''}")
+            return None
+        except Exception as e:
+            print(f"[{self.layer}] Query failed: {kind} {selector or ''}: {e}")
+            return None
+        if result.get("error"):
+            print(f"[{self.layer}] Query error: {kind} {selector or ''}: {result['error']}")
+            return None
+        self._observe_page_version(page_version)
+        if epoch == self._query_epoch and page_version == self._query_version:
+            self._query_cache[key] = result
+        return result.get("value")
+
+    async def query_many(self, queries):
+        """Run several queries in one round trip. `queries` are (kind, selector=None, name=None) tuples."""
+        return await asyncio.gather(*(self.query(*q) for q in queries))
+
+    async def _send_queries(self, queries):
+        if not self._websocket:
+            raise ConnectionError("not connected to the Hub")
+        self._query_seq += 1
+        msg_id = f"query-{self._query_seq}"
+        future = asyncio.get_running_loop().create_future()
+        self._queries[msg_id] = future
+        self.query_stats["frames"] += 1
+        try:
+            await self._websocket.send(json.dumps({
+                "jsonrpc": "2.0",
+                "method": "starlight.query",
+                "params": {"queries": queries},
+                "id": msg_id
+            }))
+            reply = await asyncio.wait_for(future, self.query_timeout)
+        finally:
+            self._queries.pop(msg_id, None)
+        results = reply.get("results") or []
+        if len(results) != len(queries):
+            raise ValueError(f"Hub answered {len(results)} of {len(queries)} queries")
+        return [(result, reply.get("pageVersion")) for result in results]
+
+    def _observe_page_version(self, version):
+        if isinstance(version, int) and version > self._query_version:
+            self._query_cache.clear()
+            self._query_version = version
+
+    def _start_query_generation(self, version):
+        """A pre_check defines the page state: answers cached before it are not reused.
+
+        Throttled entropy and scrolls do not move the version, so an equal version is no proof
+        the cache is fresh. Replies already in flight are not cached either.
+        """
+        self._invalidate_queries()
+        if isinstance(version, int):
+            self._query_version = version
+
+    def _invalidate_queries(self):
+        """A mutation arrived: the page moved past the version the cache was filled for."""
+        self._query_cache.clear()
+        self._query_epoch += 1
+
+    # --- Event Waiting ---
+
+    def _notify_watchers(self, event):
+        for predicate, future in list(self._watchers):
+            if future.done():
+                continue
+            try:
+                if predicate(event):
+                    future.set_result(event)
+            except Exception as e:
+                print(f"[{self.layer}] Watcher predicate failed: {e}")
+
+    def watch(self, predicate):
+        """Register interest in mutation/entropy events. Returns a future resolved with the first match.
+
+        Register before triggering the change (e.g. before send_action) so the event cannot be missed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._watchers.append((predicate, future))
+        return future
+
+    def unwatch(self, future):
+        self._watchers = [w for w in self._watchers if w[1] is not future]
+        if not future.done():
+            future.cancel()
+
+    async def wait_watched(self, future, timeout):
+        """Wait up to `timeout` seconds for a watched event. Returns the event or None."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @staticmethod
+    def selector_gone(selector, element_id=None):
+        """Predicate matching a mutation that detaches or hides the element for `selector`.
+
+        Only the last compound of the selector is matched, by id and class names. Class
+        patterns are shared by many elements: pass the blocking element's `element_id`
+        when it has one, and confirm other matches with element_gone().
+        """
+        parts = selector.replace(">>>", " ").split()
+        token = parts[-1] if parts else ""
+        ids = [element_id] if element_id else re.findall(r"#([\w-]+)", token)
+        classes = re.findall(r"\.([\w-]+)", token)
+
+        def predicate(event):
+            if event.get("type") != "dom_mutation" or not (ids or classes):
+                return False
+            target = event.get("target") or {}
+            if ids and target.get("id") not in ids:
+                return False
+            class_name = target.get("className")
+            names = class_name.split() if isinstance(class_name, str) else []
+            if not all(c in names for c in classes):
+                return False
+            return bool(event.get("removed")) or target.get("visibility") == "none"
+
+        return predicate
+
+    async def element_gone(self, selector, element):
+        """Ask the Hub whether the blocking `element` (an entry of pre_check's `blocking`) is gone.
+
+        Elements with an id are looked up by it; otherwise the element counts as present while
+        a visible match of `selector` still sits at its bounds. Unknown answers count as present.
+        """
+        if element.get("id") and not element.get("inShadow"):
+            return await self.query("visible", f"#{element['id']}") is False
+        bounds = element.get("bounds")
+        rects = await self.query("rects", selector)
+        if not bounds or rects is None:
+            return False
+        return not any(all(abs(r[k] - bounds[k]) <= 2 for k in ("x", "y", "width", "height")) for r in rects)
+
+    async def wait_for_quiet(self, quiet, timeout, since=None):
+        """Wait until entropy has been seen after `since` and then stayed silent for `quiet` seconds.
+
+        Returns True when settled early, False once `timeout` seconds have passed.
+        """
+        start = since if since is not None else time.monotonic()
+        deadline = start + timeout
+        is_entropy = lambda e: e.get("type") == "entropy"
+        while True:
+            now = time.monotonic()
+            last = self._last_entropy_at
+            if last > start and now - last >= quiet:
+                return True
+            if now >= deadline:
+                return False
+            window = deadline - now
+            if last > start:
+                window = min(window, quiet - (now - last))
+            future = self.watch(is_entropy)
+            try:
+                await self.wait_watched(future, window)
+            finally:
+                self.unwatch(future)
+
     # --- Communication Methods ---
 
+    # Verdicts flush buffered context first, so the Hub has it before the command proceeds
+
     async def send_clear(self):
+        await self.flush()
         await self._send_msg("starlight.clear", {})
 
     async def send_wait(self, retry_after_ms=1000):
+        await self.flush()
         await self._send_msg("starlight.wait", {"retryAfterMs": retry_after_ms})
 
     async def send_hijack(self, reason):
+        await self.flush()
         await self._send_msg("starlight.hijack", {"reason": reason})
 
     async def send_resume(self, re_check=True):
@@ -199,9 +457,46 @@ class SentinelBase(ABC):
         if text: params["text"] = text
         await self._send_msg("starlight.action", params)
 
+    async def send_redact(self, page_ranges, element_ranges, page_version=None):
+        """Report PII locations so the Hub can mask screenshots and traces.
+
+        `page_ranges` are {start, end, type} offsets into the pre_check's page_text;
+        `element_ranges` add the element's index into the pre_check's `blocking` list and
+        its selector. Offsets are UTF-16 code units, as JavaScript strings count them; an
+        optional `digest` (first 16 hex chars of the value's SHA-256) lets the Hub check them.
+        """
+        await self._send_msg("starlight.redact", {
+            "pageVersion": page_version,
+            "page": page_ranges,
+            "elements": element_ranges
+        })
+
     async def update_context(self, context_data):
-        """Inject data into the Hub's sovereign state."""
-        await self._send_msg("starlight.context_update", {"context": context_data})
+        """Inject data into the Hub's sovereign state.
+
+        Updates within `sentinel.contextFlushMs` are merged and sent as one frame. The merge
+        is shallow, like the Hub's: a top-level key replaces the previous value whole, so
+        the result does not depend on whether two updates share a window. Call flush()
+        to send right away; buffered updates are also flushed before the sentinel exits.
+        """
+        self.context_stats["updates"] += 1
+        self._context_buffer.update(context_data)
+        if self.context_flush_window <= 0:
+            await self.flush()
+        elif self._context_flush is None:
+            self._context_flush = asyncio.get_running_loop().call_later(
+                self.context_flush_window, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Send buffered context updates now."""
+        if self._context_flush is not None:
+            self._context_flush.cancel()
+            self._context_flush = None
+        if not self._context_buffer:
+            return
+        pending, self._context_buffer = self._context_buffer, {}
+        self.context_stats["frames"] += 1
+        await self._send_msg("starlight.context_update", {"context": pending})
 
     async def _send_msg(self, method, params):
         if self._websocket:
@@ -228,7 +523,16 @@ class SentinelBase(ABC):
         pass
 
     async def on_context_update(self, context):
+        """Called with the full replica (`self.context`) after every snapshot or applied delta."""
+        pass
+
+    async def on_context_delta(self, ops, version):
+        """Called with the JSON-Patch style ops of each delta, after they are applied to `self.context`."""
         pass
 
     async def on_message(self, method, params, msg_id):
         pass
+
+    async def on_shutdown(self):
+        """Release long-lived resources (clients, files) before the sentinel exits."""
+        pass
@@ -21,6 +21,7 @@ class DataSentinel(SentinelBase):
         self.selectors = []  # No blocking patterns to watch
         self.last_extraction = 0
         self.extraction_interval = 5  # seconds between extractions
+        self._inject_task = None  # Background metadata extraction for the latest pre_check
 
     async def on_pre_check(self, params, msg_id):
         """Extract metadata from pre-check context and inject intelligence."""
@@ -35,13 +36,38 @@ class DataSentinel(SentinelBase):
             "sentinelStatus": "ACTIVE"
         }
         
+        # Always clear first - we don't block commands, and metadata is not worth the wait
+        await self.send_clear()
+        
         # Only inject if we have meaningful data
         if any([command.get("cmd"), command.get("goal"), command.get("url")]):
-            await self.update_context(intelligence)
-            print(f"[{self.layer}] Injected context: cmd={command.get('cmd')}, goal={command.get('goal')}")
-        
-        # Always clear - we don't block commands
-        await self.send_clear()
+            if self._inject_task and not self._inject_task.done():
+                self._inject_task.cancel()  # Superseded by this pre_check
+            self._inject_task = asyncio.create_task(self._inject(intelligence, command))
+
+    async def _inject(self, intelligence, command):
+        intelligence["page"] = await self.extract_page_metadata()
+        await self.update_context(intelligence)
+        print(f"[{self.layer}] Injected context: cmd={command.get('cmd')}, goal={command.get('goal')}")
+
+    async def extract_page_metadata(self):
+        """Pull page facts from the Hub in one starlight.query round trip."""
+        title, url, forms, links, inputs, dialogs = await self.query_many([
+            ("title",),
+            ("url",),
+            ("count", "form"),
+            ("count", "a[href]"),
+            ("count", "input, select, textarea"),
+            ("count", "dialog[open], [role='dialog'], [aria-modal='true']")
+        ])
+        return {
+            "title": title,
+            "url": url,
+            "forms": forms,
+            "links": links,
+            "inputs": inputs,
+            "dialogs": dialogs
+        }
 
     async def on_entropy(self, params):
         """Periodically extract and inject environmental state."""
@@ -7,13 +7,75 @@ Features persistent memory for learned remediation strategies.
 """
 
 import asyncio
+import time
 import sys
 import os
 
+try:
+    import numpy as np
+except ImportError:  # Optional: fall back to pure-Python geometry
+    np = None
+
 # Path boilerplate for local imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sdk.starlight_sdk import SentinelBase
 
+
+def element_box(element):
+    """Return (x, y, w, h) from a blocking element's bounds, or None if unknown."""
+    bounds = element.get("bounds")
+    if not isinstance(bounds, dict):
+        return None
+    try:
+        return (float(bounds["x"]), float(bounds["y"]),
+                float(bounds["width"]), float(bounds["height"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def occlusion_ratios(target_rect, boxes):
+    """Fraction of the target's area covered by each (x, y, w, h) box."""
+    tx, ty = float(target_rect.get("x", 0)), float(target_rect.get("y", 0))
+    tw, th = float(target_rect.get("width", 0)), float(target_rect.get("height", 0))
+    target_area = tw * th
+    if not boxes or target_area <= 0:
+        return [0.0] * len(boxes)
+
+    if np is not None:
+        b = np.asarray(boxes, dtype=float)
+        ix = np.minimum(tx + tw, b[:, 0] + b[:, 2]) - np.maximum(tx, b[:, 0])
+        iy = np.minimum(ty + th, b[:, 1] + b[:, 3]) - np.maximum(ty, b[:, 1])
+        inter = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+        return (inter / target_area).tolist()
+
+    ratios = []
+    for x, y, w, h in boxes:
+        ix = min(tx + tw, x + w) - max(tx, x)
+        iy = min(ty + th, y + h) - max(ty, y)
+        ratios.append(max(ix, 0.0) * max(iy, 0.0) / target_area)
+    return ratios
+
+
+# Remediation lifecycle states (one record per in-flight command)
+IDLE = "idle"
+HIJACKING = "hijacking"
+VERIFYING = "verifying"
+
+
+class Remediation:
+    """Remediation state for a single command, so concurrent pre_checks never share flags."""
+
+    def __init__(self, key, command_id):
+        self.key = key
+        self.command_id = command_id
+        self.state = IDLE
+        self.obstacle_id = None
+        self.attempts = 0
+        self.tried_selectors = []  # Track ALL selectors tried during exploration
+        self.last_action = None  # Most recent action, learned on success
+        self.completed = None  # COMMAND_COMPLETE success flag, if it arrived mid-remediation
+
+
 class JanitorSentinel(SentinelBase):
     def __init__(self):
         super().__init__(layer_name="JanitorSentinel", priority=5)
@@ -21,6 +83,8 @@ class JanitorSentinel(SentinelBase):
         janitor_config = self.config.get("janitor", {})
         self.exploration_delay = janitor_config.get("explorationDelayMs", 300) / 1000.0
         self.remediation_delay = janitor_config.get("remediationDelayMs", 1000) / 1000.0
+        # Minimum fraction of the target's area an obstacle must cover to be cleared
+        self.occlusion_threshold = janitor_config.get("occlusionThreshold", 0.0)
         # Comprehensive blocking patterns for common UI obstacles
         self.blocking_patterns = [
             # Modals and Popups
@@ -39,141 +103,223 @@ class JanitorSentinel(SentinelBase):
             ".close-btn", ".dismiss-btn", "[data-dismiss]", ".btn-close"
         ]
         self.selectors = self.blocking_patterns 
-        self.is_hijacking = False
-        self.tried_selectors = []  # Track ALL selectors tried during exploration
-        self.current_action_selector = None  # Track most recent action for learning
+        self.remediations = {}  # command key -> Remediation
+        self.active_obstacles = {}  # obstacle id -> command key currently remediating it
+
+    def _command_key(self, command):
+        """Stable per-command key, scoped to the issuing mission when known."""
+        cmd_id = command.get("id") or command.get("goal") or command.get("selector") or command.get("url") or command.get("cmd")
+        return f"{command.get('clientId', '')}:{cmd_id}"
+
+    @staticmethod
+    def _in_viewport(rect, viewport):
+        """Whether any part of `rect` is on screen."""
+        return (rect["x"] < viewport.get("width", 0) and rect["x"] + rect["width"] > 0 and
+                rect["y"] < viewport.get("height", 0) and rect["y"] + rect["height"] > 0)
 
     async def on_pre_check(self, params, msg_id):
         blocking = params.get("blocking", [])
         target_rect = params.get("targetRect")  # Target element's bounding rect
         command = params.get("command", {})
         
-        # Skip if no blocking elements or already hijacking
-        if not blocking or self.is_hijacking:
-            if not self.is_hijacking:
-                await self.send_clear()
+        key = self._command_key(command)
+        rem = self.remediations.get(key)
+        
+        # A re-check that races an in-progress remediation must still get an answer
+        if rem and rem.state in (HIJACKING, VERIFYING):
+            await self.send_wait(int(self.remediation_delay * 1000))
             return
         
+        if not blocking:
+            await self.send_clear()
+            return
+        
+        candidates = []
         for b in blocking:
-            matched_pattern = None
             for pattern in self.blocking_patterns:
                 if pattern.replace('.', '') in b.get("className", "") or pattern.replace('#', '') == b.get("id", ""):
-                    matched_pattern = pattern
+                    candidates.append((b, b.get('selector', pattern)))
                     break
+        
+        # A target still outside the viewport will be scrolled to by the action; where
+        # obstacles land then is unknown, so every candidate counts as occluding
+        viewport = params.get("viewport")
+        if target_rect and viewport and not self._in_viewport(target_rect, viewport):
+            target_rect = None
+        
+        # SMART OVERLAP CHECK: Only clear obstacles that actually occlude the target
+        if target_rect and candidates:
+            boxes = [element_box(b) for b, _ in candidates]
+            known = [i for i, box in enumerate(boxes) if box is not None]
+            ratios = dict(zip(known, occlusion_ratios(target_rect, [boxes[i] for i in known])))
             
-            if matched_pattern:
-                obstacle_id = b.get('selector', matched_pattern)
-                
-                # SMART OVERLAP CHECK: Only clear if obstacle actually overlaps target or covers viewport
-                if target_rect and b.get("rect"):
-                    # Parse obstacle rect
-                    try:
-                        obs_dims = b["rect"].split("x")
-                        obs_width, obs_height = int(obs_dims[0]), int(obs_dims[1])
-                        
-                        # If obstacle is small and doesn't cover significant viewport, skip
-                        # Large overlays (modal backdrops) typically cover full viewport
-                        if obs_width < 500 and obs_height < 500:
-                            print(f"[{self.layer}] Skipping {obstacle_id} - small element, unlikely to block target")
-                            continue
-                    except:
-                        pass  # If parsing fails, proceed with clearing
-                
-                # DEDUPLICATION: Skip if we just cleared this same obstacle
-                if hasattr(self, '_last_cleared') and self._last_cleared == obstacle_id:
-                    if hasattr(self, '_clear_count') and self._clear_count > 2:
-                        print(f"[{self.layer}] Giving up on {obstacle_id} after 3 attempts - proceeding anyway")
-                        await self.send_clear()
-                        return
-                    self._clear_count = getattr(self, '_clear_count', 0) + 1
+            occluding = []
+            for i, (b, obstacle_id) in enumerate(candidates):
+                # Elements without bounds (older Hubs) are assumed to block
+                ratio = ratios.get(i, 1.0)
+                if ratio > self.occlusion_threshold:
+                    occluding.append((ratio, b, obstacle_id))
                 else:
-                    self._last_cleared = obstacle_id
-                    self._clear_count = 1
-                
-                await self.perform_remediation(obstacle_id)
-                return
+                    print(f"[{self.layer}] Skipping {obstacle_id} - does not occlude target")
+            occluding.sort(key=lambda o: o[0], reverse=True)
+            obstacles = [(b, obstacle_id) for _, b, obstacle_id in occluding]
+        else:
+            obstacles = candidates
+        
+        # Obstacles already being cleared for another command are left to that pipeline
+        pending = [o for _, o in obstacles if self.active_obstacles.get(o, key) != key]
+        obstacles = [(b, o) for b, o in obstacles if o not in pending]
+        
+        if obstacles:
+            element, obstacle_id = obstacles[0]
+            if rem is None:
+                rem = self.remediations[key] = Remediation(key, command.get("id"))
+            
+            # DEDUPLICATION: Skip if we just cleared this same obstacle
+            if rem.obstacle_id == obstacle_id:
+                if rem.attempts > 2:
+                    print(f"[{self.layer}] Giving up on {obstacle_id} after 3 attempts - proceeding anyway")
+                    await self.send_clear()
+                    return
+                rem.attempts += 1
+            else:
+                rem.obstacle_id = obstacle_id
+                rem.attempts = 1
+            
+            await self.perform_remediation(rem, obstacle_id, element)
+            return
+        
+        if pending:
+            print(f"[{self.layer}] Waiting on in-flight remediation of {pending[0]}")
+            await self.send_wait(int(self.remediation_delay * 1000))
+            return
         
         # No blocking elements matched or all were skipped
         await self.send_clear()
 
-    async def perform_remediation(self, obstacle_id):
-        if self.is_hijacking: 
+    async def _wait_gone(self, gone, predicate, obstacle_id, element, timeout):
+        """Wait up to `timeout` for the blocking element to go. Returns (watch future, gone).
+
+        A mutation on another element matching the same pattern (a second .toast) also fires
+        the watch, so each hit is confirmed with a query and the watch re-armed if it was not ours.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or await self.wait_watched(gone, remaining) is None:
+                return gone, False
+            if await self.element_gone(obstacle_id, element):
+                return gone, True
+            self.unwatch(gone)
+            gone = self.watch(predicate)
+
+    async def perform_remediation(self, rem, obstacle_id, element=None):
+        if rem.state in (HIJACKING, VERIFYING):
             return
-        self.is_hijacking = True
-        self.tried_selectors = []  # Reset for this remediation attempt
+        element = element or {}
+        rem.state = HIJACKING
+        rem.tried_selectors = []  # Reset for this remediation attempt
+        self.active_obstacles[obstacle_id] = rem.key
+        # Watch for the obstacle detaching/hiding before the first click so the event can't be missed
+        predicate = self.selector_gone(obstacle_id, None if element.get("inShadow") else element.get("id"))
+        gone = self.watch(predicate)
         
-        best_action = self.memory.get(obstacle_id)
-        if best_action:
-            print(f"[{self.layer}] Phase 7: Recalling best action for {obstacle_id} -> {best_action}")
-            await self.send_hijack(f"Predictive remediation for {obstacle_id}")
-            await self.send_action("click", best_action)
-            self.last_action = {"id": obstacle_id, "selector": best_action, "known": True}
-        else:
-            print(f"[{self.layer}] !!! HIJACKING !!! Reason: Detected {obstacle_id}")
-            await self.send_hijack(f"Janitor heuristic healing for {obstacle_id}")
-            
-            # Heuristic exploration - try multiple selectors
-            fallback_selectors = [
-                # ID-based (most specific)
-                "#newsletter-close",
-                "#cookie-accept", 
-                "#cookie-decline",
-                "#close-btn",
-                "#custom-close",
-                # Class-based
-                f"{obstacle_id} .close", 
-                f"{obstacle_id} .btn-close",
-                f"{obstacle_id} button",
-                ".modal-close", 
-                ".close-btn",
-                ".btn-close",
-                ".btn-accept",
-                ".btn-decline",
-                # Text-based (Playwright format)
-                "button:has-text('No Thanks')",
-                "button:has-text('Close')",
-                "button:has-text('OK')",
-                "button:has-text('Accept')",
-                "button:has-text('Decline')",
-                "button:has-text('Got it')",
-                "button:has-text('Dismiss')",
-            ]
-            
-            for selector in fallback_selectors:
-                full_sel = f"{selector} >> visible=true"
-                print(f"[{self.layer}] Trying heuristic: {full_sel}")
-                await self.send_action("click", full_sel)
-                self.tried_selectors.append(full_sel)
-                self.current_action_selector = full_sel  # Track for learning
-                await asyncio.sleep(self.exploration_delay)
-            
-            # Logic Fix: Store the current selector being tried; on success, we learn it
-            self.last_action = {"id": obstacle_id, "selector": self.current_action_selector, "known": False}
+        try:
+            best_action = self.memory.get(obstacle_id)
+            if best_action:
+                print(f"[{self.layer}] Phase 7: Recalling best action for {obstacle_id} -> {best_action}")
+                await self.send_hijack(f"Predictive remediation for {obstacle_id}")
+                await self.send_action("click", best_action)
+                rem.last_action = {"id": obstacle_id, "selector": best_action, "known": True}
+            else:
+                print(f"[{self.layer}] !!! HIJACKING !!! Reason: Detected {obstacle_id}")
+                await self.send_hijack(f"Janitor heuristic healing for {obstacle_id}")
+                
+                # Heuristic exploration - try multiple selectors
+                fallback_selectors = [
+                    # ID-based (most specific)
+                    "#newsletter-close",
+                    "#cookie-accept", 
+                    "#cookie-decline",
+                    "#close-btn",
+                    "#custom-close",
+                    # Class-based
+                    f"{obstacle_id} .close", 
+                    f"{obstacle_id} .btn-close",
+                    f"{obstacle_id} button",
+                    ".modal-close", 
+                    ".close-btn",
+                    ".btn-close",
+                    ".btn-accept",
+                    ".btn-decline",
+                    # Text-based (Playwright format)
+                    "button:has-text('No Thanks')",
+                    "button:has-text('Close')",
+                    "button:has-text('OK')",
+                    "button:has-text('Accept')",
+                    "button:has-text('Decline')",
+                    "button:has-text('Got it')",
+                    "button:has-text('Dismiss')",
+                ]
+                
+                for selector in fallback_selectors:
+                    full_sel = f"{selector} >> visible=true"
+                    print(f"[{self.layer}] Trying heuristic: {full_sel}")
+                    await self.send_action("click", full_sel)
+                    rem.tried_selectors.append(full_sel)
+                    gone, is_gone = await self._wait_gone(gone, predicate, obstacle_id, element, self.exploration_delay)
+                    if is_gone:
+                        print(f"[{self.layer}] {obstacle_id} is gone - stopping exploration")
+                        break
+                
+                # Logic Fix: Store the last selector tried; on success, we learn it
+                last_tried = rem.tried_selectors[-1] if rem.tried_selectors else None
+                rem.last_action = {"id": obstacle_id, "selector": last_tried, "known": False}
+
+            # remediationDelayMs is only an upper bound: resume as soon as the obstacle is gone
+            rem.state = VERIFYING
+            gone, _ = await self._wait_gone(gone, predicate, obstacle_id, element, self.remediation_delay)
+            await self.send_resume(re_check=True)
+        finally:
+            self.unwatch(gone)
+            rem.state = IDLE
+            if self.active_obstacles.get(obstacle_id) == rem.key:
+                del self.active_obstacles[obstacle_id]
+            if rem.completed is not None:
+                # The command finished while we were remediating: settle it now
+                self._complete(rem, rem.completed)
 
-        await asyncio.sleep(self.remediation_delay)
-        await self.send_resume(re_check=True)
-        self.is_hijacking = False
+    def _complete(self, rem, success):
+        """Learn from a finished command's remediation and drop its record."""
+        action = rem.last_action
+        if action and success and not action.get("known"):
+            # Logic Fix: Learn the selector that was used in last_action
+            obs_id = action["id"]
+            sel = action.get("selector")
+            if sel and self.memory.get(obs_id) != sel:
+                print(f"[{self.layer}] LEARNING remediation! {obs_id} -> {sel}")
+                self.memory[obs_id] = sel
+                self._save_memory()
+        
+        # Command finished: its remediation record is no longer needed
+        if self.remediations.get(rem.key) is rem:
+            del self.remediations[rem.key]
 
     async def on_message(self, method, params, msg_id):
         """Learn from command completion feedback."""
         m_type = params.get("type") if isinstance(params, dict) else None
         
-        if m_type == "COMMAND_COMPLETE" and self.last_action:
-            if params.get("success", True):
-                obs_id = self.last_action["id"]
-                
-                if self.last_action.get("known"):
-                    # Already knew the right selector, nothing to learn
-                    pass
+        if m_type == "COMMAND_COMPLETE":
+            cmd_id = params.get("id")
+            success = params.get("success", True)
+            for rem in list(self.remediations.values()):
+                if rem.command_id != cmd_id:
+                    continue
+                if rem.state in (HIJACKING, VERIFYING):
+                    # perform_remediation settles it once the remediation unwinds
+                    rem.completed = success
                 else:
-                    # Logic Fix: Learn the selector that was used in last_action
-                    sel = self.last_action.get("selector")
-                    if sel and self.memory.get(obs_id) != sel:
-                        print(f"[{self.layer}] LEARNING remediation! {obs_id} -> {sel}")
-                        self.memory[obs_id] = sel
-                        self._save_memory()
-            
-            self.last_action = None
+                    self._complete(rem, success)
 
 if __name__ == "__main__":
     sentinel = JanitorSentinel()
@@ -7,6 +7,8 @@ screenshots are taken, ensuring compliance with GDPR, HIPAA, and PCI-DSS.
 """
 
 import asyncio
+import bisect
+import hashlib
 import re
 import sys
 import os
@@ -14,6 +16,24 @@ import os
 # Path boilerplate for local imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sdk.starlight_sdk import SentinelBase
+from sdk.pii_scanner import PIIScanner, IncrementalScanner, DEFAULT_PATTERNS, DEFAULT_ANCHORS
+
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+
+def utf16_offsets(text, offsets):
+    """Map code-point offsets into `text` to UTF-16 code units, which JS String.slice counts.
+
+    Characters outside the BMP (emoji, etc.) are one code point but two code units.
+    """
+    astral = [m.start() for m in _ASTRAL.finditer(text)]
+    return {o: o + bisect.bisect_left(astral, o) for o in offsets}
+
+
+def value_digest(value):
+    """Short SHA-256 of a PII value, so the Hub can check a range without the value itself being sent."""
+    return hashlib.sha256(value.encode("utf-8", "replace")).hexdigest()[:16]
+
 
 class PIISentinel(SentinelBase):
     def __init__(self):
@@ -23,47 +43,60 @@ class PIISentinel(SentinelBase):
         # Load PII config
         pii_config = self.config.get("pii", {})
         self.mode = pii_config.get("mode", "alert")  # "alert", "block", or "redact"
-        self.patterns = self._compile_patterns(pii_config.get("patterns", {}))
+        self.scanner = self._compile_patterns(pii_config.get("patterns", {}))
+        
+        # Cache findings per content-addressed chunk so unchanged page text is not rescanned
+        incremental_config = pii_config.get("incremental", {})
+        self.incremental = None
+        if incremental_config.get("enabled", True):
+            self.incremental = IncrementalScanner(
+                self.scanner,
+                min_chunk=incremental_config.get("minChunk", 1024),
+                max_chunk=incremental_config.get("maxChunk", 8192),
+                junction=incremental_config.get("junction", 128),
+                max_bytes=incremental_config.get("maxBytes", 32 << 20)
+            )
         self.detected_pii = []
+        self._masking = False  # Whether the Hub currently holds a redaction mask from us
         
     def _compile_patterns(self, custom_patterns):
-        """Compile regex patterns for PII detection."""
-        # Default patterns for common PII types
-        default_patterns = {
-            "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-            "ssn": r'\b\d{3}-\d{2}-\d{4}\b',
-            "credit_card": r'\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|6(?:011|5[0-9]{2})[0-9]{12})\b',
-            "phone_us": r'\b(?:\+1[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b',
-            "ip_address": r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
-            "date_of_birth": r'\b(?:0[1-9]|1[0-2])[/-](?:0[1-9]|[12]\d|3[01])[/-](?:19|20)\d{2}\b',
-        }
-        
-        # Merge with custom patterns
-        all_patterns = {**default_patterns, **custom_patterns}
+        """Compile all PII patterns into a single-pass scanner."""
+        # Default patterns for common PII types, merged with custom patterns.
+        # Anchors only apply to defaults that were not overridden.
+        all_patterns = {**DEFAULT_PATTERNS, **custom_patterns}
+        anchors = {name: a for name, a in DEFAULT_ANCHORS.items() if name not in custom_patterns}
         
-        compiled = {}
-        for name, pattern in all_patterns.items():
-            try:
-                compiled[name] = re.compile(pattern, re.IGNORECASE)
-            except re.error as e:
-                print(f"[{self.layer}] Warning: Invalid regex for {name}: {e}")
+        scanner = PIIScanner(all_patterns, anchors=anchors, flags=re.IGNORECASE)
+        for name, error in scanner.errors.items():
+            print(f"[{self.layer}] Warning: Invalid regex for {name}: {error}")
+        if scanner.separate:
+            print(f"[{self.layer}] Scanning {list(scanner.separate)} separately (cannot join combined pattern)")
         
-        return compiled
+        return scanner
     
     def scan_for_pii(self, text):
-        """Scan text for PII patterns. Returns list of findings."""
-        findings = []
+        """Scan text for PII patterns in a single pass. Returns list of findings."""
+        return list(self.iter_pii([text]))
+    
+    def iter_pii(self, segments):
+        """Lazily yield findings from each text segment, without joining them.
         
-        for pii_type, pattern in self.patterns.items():
-            matches = pattern.findall(text)
-            for match in matches:
-                findings.append({
+        Large segments are walked chunk by chunk, so stopping early skips the rest of the page.
+        Each finding records its segment index and character offsets within that segment.
+        """
+        for index, text in enumerate(segments):
+            if not text or text.isspace():
+                continue
+            matches = self.incremental.iter_scan(text) if self.incremental else self.scanner.finditer(text)
+            for pii_type, start, end, match in matches:
+                yield {
                     "type": pii_type,
                     "value": self._redact(match),  # Never log actual PII
-                    "raw_length": len(match)
-                })
-        
-        return findings
+                    "raw_length": len(match),
+                    "segment": index,
+                    "start": start,
+                    "end": end
+                }
     
     def _redact(self, value):
         """Redact sensitive value for logging."""
@@ -79,42 +112,76 @@ class PIISentinel(SentinelBase):
         blocking = params.get("blocking", [])
         page_text = params.get("page_text", "")
         
-        # Scan any text content we have access to
-        all_text = page_text
-        for element in blocking:
-            all_text += " " + element.get("text", "")
+        # Scan any text content we have access to, one segment at a time
+        segments = [page_text] + [element.get("text", "") for element in blocking]
+        if self.mode == "block":
+            # One finding is enough to block: stop scanning there
+            first = next(self.iter_pii(segments), None)
+            findings = [first] if first else []
+        else:
+            findings = list(self.iter_pii(segments))
+        if self.incremental:
+            stats = self.incremental.stats()
+            print(f"[{self.layer}] Chunk cache: {stats['entries']} entries, hit rate {stats['hitRate']:.0%}")
         
-        if all_text.strip():
-            findings = self.scan_for_pii(all_text)
+        if findings:
+            self.detected_pii = findings
+            types_found = list(set(f["type"] for f in findings))
             
-            if findings:
-                self.detected_pii = findings
-                types_found = list(set(f["type"] for f in findings))
-                
+            if self.mode == "block":
+                print(f"[{self.layer}] ⚠️  PII DETECTED: {types_found} (scan stopped at first finding)")
+            else:
                 print(f"[{self.layer}] ⚠️  PII DETECTED: {len(findings)} instances of {types_found}")
-                
-                if self.mode == "block":
-                    print(f"[{self.layer}] 🚫 BLOCKING execution - PII found in page")
-                    await self.send_hijack(f"PII Compliance Block: {types_found}")
-                    # Log the event but don't proceed
-                    await self._log_pii_event(findings, blocked=True)
-                    await asyncio.sleep(2)
-                    await self.send_resume(re_check=False)
-                    return
-                elif self.mode == "alert":
-                    print(f"[{self.layer}] ⚠️  ALERT: Proceeding with PII warning")
-                    await self._log_pii_event(findings, blocked=False)
+            
+            if self.mode == "block":
+                print(f"[{self.layer}] 🚫 BLOCKING execution - PII found in page")
+                await self.send_hijack(f"PII Compliance Block: {types_found}")
+                # Log the event but don't proceed
+                await self._log_pii_event(findings, blocked=True)
+                await asyncio.sleep(2)
+                await self.send_resume(re_check=False)
+                return
+            elif self.mode == "alert":
+                print(f"[{self.layer}] ⚠️  ALERT: Proceeding with PII warning")
+                await self._log_pii_event(findings, blocked=False)
+        
+        if self.mode == "redact" and (findings or self._masking):
+            await self._send_redactions(findings, segments, blocking, params.get("pageVersion"))
         
         # Clear for execution
         await self.send_clear()
     
+    async def _send_redactions(self, findings, segments, blocking, page_version):
+        """Redact mode: tell the Hub where the PII is instead of stalling the mission."""
+        # The Hub slices with JS strings: offsets go out in UTF-16 code units
+        offsets = {}
+        for f in findings:
+            offsets.setdefault(f["segment"], set()).update((f["start"], f["end"]))
+        units = {index: utf16_offsets(segments[index], spots) for index, spots in offsets.items()}
+        page_ranges, element_ranges = [], []
+        for f in findings:
+            mapped = units[f["segment"]]
+            span = {"start": mapped[f["start"]], "end": mapped[f["end"]], "type": f["type"],
+                    "digest": value_digest(segments[f["segment"]][f["start"]:f["end"]])}
+            if f["segment"] == 0:
+                page_ranges.append(span)
+            else:
+                # Selectors are shared patterns (".modal"): the index says which element's text this is
+                index = f["segment"] - 1
+                element_ranges.append({"index": index, "selector": blocking[index].get("selector"), **span})
+        await self.send_redact(page_ranges, element_ranges, page_version)
+        self._masking = bool(findings)
+        if findings:
+            print(f"[{self.layer}] 🛡️  REDACT: Masking {len(page_ranges)} page spans and {len(element_ranges)} element spans")
+            await self._log_pii_event(findings, blocked=False)
+
     async def _log_pii_event(self, findings, blocked):
         """Log PII detection event to sovereign context."""
         event = {
             "pii_detected": True,
             "pii_count": len(findings),
             "pii_types": list(set(f["type"] for f in findings)),
-            "action_taken": "blocked" if blocked else "alerted",
+            "action_taken": "blocked" if blocked else ("redacted" if self.mode == "redact" else "alerted"),
             "compliance_mode": self.mode
         }
         await self.update_context({"security": event})
@@ -1,5 +1,5 @@
 """
-Pulse Sentinel - Temporal Stability Monitor (v2.8)
+Pulse Sentinel - Temporal Stability Monitor (v2.11)
 Part of the Starlight Protocol - Phase 9 Animation Tolerance
 
 Monitors "Environmental Entropy" (Network/DOM noise) to ensure 
@@ -7,12 +7,25 @@ the browser is settled before allowing Intent execution.
 
 v2.8: Added animation tolerance with max veto count to handle
 sites with continuous CSS animations.
+
+v2.9: Predicts retryAfterMs from an EWMA of entropy inter-arrival gaps
+and learned per-URL burst durations, persisted as settle profiles.
+
+v2.10: Classifies steady periodic noise (carousels, spinners) as settled
+using autocorrelation of the binned entropy series, cached per page.
+
+v2.11: Optional push mode holds the veto and pushes `clear` the moment
+the silence window is met, instead of round-tripping `wait`.
 """
 
 import asyncio
+import bisect
 import sys
 import os
+import re
 import time
+from collections import deque
+from urllib.parse import urlparse
 
 # Path boilerplate for local imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -28,15 +41,220 @@ class PulseSentinel(SentinelBase):
         self.is_stable = False
         self.veto_count = 0
         self.current_command_id = None
+        
+        # v2.9: Entropy-rate model
+        self.entropy_times = deque(maxlen=64)  # Ring buffer of recent entropy timestamps
+        self.ewma_alpha = self.config.get("sentinel", {}).get("settleEwmaAlpha", 0.3)
+        self.gap_ewma = None  # Smoothed inter-arrival gap within a burst (seconds)
+        self.burst_start = None
+        self.load_burst = False  # Whether the current burst is the first one after a goto
+        self._expect_load = False  # Set by a goto pre_check: the next burst is its page load
+        self.url_pattern = "*"
+        self._profiles_dirty = False
+        
+        # v2.10: Periodic-animation detector
+        sentinel_config = self.config.get("sentinel", {})
+        self.periodic_bin = sentinel_config.get("periodicBinMs", 50) / 1000.0
+        self.periodic_bins = max(8, int(sentinel_config.get("periodicWindowMs", 3200) / 1000.0 / self.periodic_bin))
+        self.periodic_threshold = sentinel_config.get("periodicThreshold", 0.5)
+        # The Hub throttles entropy broadcasts, so any busy series repeats at the throttle
+        # interval; only periods clearly longer than that say anything about the page.
+        throttle = self.config.get("hub", {}).get("entropyThrottle", 100) / 1000.0
+        self.periodic_throttle_lag = max(1, round(throttle / self.periodic_bin))
+        self.periodic_min_lag = int(throttle / self.periodic_bin) + 2
+        self.periodic_ttl = sentinel_config.get("periodicTtlMs", 5000) / 1000.0
+        self.periodic_recurrence = sentinel_config.get("periodicRecurrence", 0.8)  # Share of events seen again one period later
+        self.periodic_jitter = sentinel_config.get("periodicJitterMs", 15) / 1000.0
+        self.periodic_pages = {}  # url pattern -> {"period", "at"} of the last detection
+        
+        # v2.11: Push-mode stability notifications
+        self.push_mode = sentinel_config.get("pushMode", False)
+        self.push_max_hold = sentinel_config.get("pushMaxHoldMs", 5000) / 1000.0
+        self._hold = None  # {"cmd", "window"} of the pre_check awaiting a pushed clear
+        self._push_timer = None  # Silence timer, re-armed on every entropy event
+        self._hold_deadline = None  # Upper bound on how long a veto is held
+
+    def _hold_veto(self, cmd, window, delay):
+        """Hold the pre_check open and push `clear` once `window` seconds of silence are reached."""
+        self._cancel_hold()
+        loop = asyncio.get_running_loop()
+        self._hold = {"cmd": cmd, "window": window}
+        self._push_timer = loop.call_later(delay, self._release_hold, "settled")
+        self._hold_deadline = loop.call_later(self.push_max_hold, self._release_hold, "max hold reached")
+
+    def _cancel_hold(self):
+        for handle in (self._push_timer, self._hold_deadline):
+            if handle:
+                handle.cancel()
+        self._hold = self._push_timer = self._hold_deadline = None
+
+    def _release_hold(self, reason):
+        if not self._hold:
+            return
+        cmd = self._hold["cmd"]
+        self._cancel_hold()
+        if reason == "settled":
+            self.is_stable = True
+        print(f"[{self.layer}] PUSH CLEAR for {cmd} ({reason}).")
+        self.veto_count = 0
+        asyncio.ensure_future(self.send_clear())
+
+    @staticmethod
+    def url_pattern_for(url):
+        """Collapse a URL to host + path with numeric/hex segments wildcarded."""
+        parsed = urlparse(url)
+        segments = [re.sub(r"^(\d+|[0-9a-f]{8,})$", "*", seg) for seg in parsed.path.split("/") if seg]
+        return parsed.netloc + "/" + "/".join(segments)
+
+    def _ewma(self, previous, sample):
+        return sample if previous is None else self.ewma_alpha * sample + (1 - self.ewma_alpha) * previous
+
+    def _settle_profile(self):
+        return self.memory.get("settleProfiles", {}).get(self.url_pattern)
+
+    def _record_burst(self, duration):
+        """Fold a finished page-load burst into the settle profile for the current URL pattern."""
+        profiles = self.memory.setdefault("settleProfiles", {})
+        profile = profiles.get(self.url_pattern, {"burstMs": None, "gapMs": None, "samples": 0})
+        profile["burstMs"] = round(self._ewma(profile["burstMs"], duration * 1000))
+        if self.gap_ewma is not None:
+            profile["gapMs"] = round(self.gap_ewma * 1000)
+        profile["samples"] += 1
+        profiles[self.url_pattern] = profile
+        self._profiles_dirty = True
+
+    def detect_periodicity(self, now=None):
+        """Return the dominant period (seconds) if recent entropy is sustained periodic noise, else None.
+
+        Entropy timestamps are binned into a fixed-size count series covering the analysis
+        window. Loading bursts leave gaps somewhere in the window; animations keep every
+        quarter busy and show a strong autocorrelation peak at their period. Sustained
+        loading arrives at the Hub's entropy throttle rate, so series that repeat at the
+        throttle interval are rejected and only lags clearly longer than it are considered.
+        A candidate period must then hold up on the raw timestamps: busy-but-aperiodic
+        traffic correlates by chance, but its events do not recur one period apart.
+        """
+        now = now if now is not None else time.time()
+        bins = self.periodic_bins
+        series = [0.0] * bins
+        for t in self.entropy_times:
+            idx = int((now - t) / self.periodic_bin)
+            if 0 <= idx < bins:
+                series[bins - 1 - idx] += 1
+        
+        quarter = bins // 4
+        if any(sum(series[i:i + quarter]) == 0 for i in range(0, quarter * 4, quarter)):
+            return None
+        
+        mean = sum(series) / bins
+        dev = [x - mean for x in series]
+        variance = sum(d * d for d in dev)
+        if variance == 0:
+            return None  # Evenly busy: indistinguishable from a page that is still loading
+        
+        def autocorr(lag):
+            return sum(dev[i] * dev[i + lag] for i in range(bins - lag)) / variance
+        
+        # Loading paced by the throttle correlates at every multiple of its interval,
+        # so a real period must stand clear of the correlation at the throttle lag.
+        floor = max(0.0, autocorr(self.periodic_throttle_lag)) + self.periodic_threshold / 2
+        best_lag, best_r = None, floor
+        for lag in range(self.periodic_min_lag, bins // 2):
+            r = autocorr(lag)
+            if r > best_r:
+                best_lag, best_r = lag, r
+        if best_lag is None or best_r < self.periodic_threshold:
+            return None
+        
+        # Busy-but-aperiodic streams can still correlate at one lag by chance. A real
+        # animation also repeats at twice the period, leaves a quiet stretch in every
+        # cycle, and nearly every event recurs exactly one period later.
+        period = best_lag * self.periodic_bin
+        if 2 * best_lag < bins and autocorr(2 * best_lag) < self.periodic_threshold / 2:
+            return None
+        phases = [sum(series[i::best_lag]) for i in range(best_lag)]
+        if sum(1 for p in phases if p <= max(phases) / 4) * 3 < best_lag:
+            return None
+        # The binned lag is coarse: refine it to the median exact recurrence distance,
+        # then count events that recur within a few milliseconds of it
+        times = sorted(t for t in self.entropy_times if now - t < bins * self.periodic_bin)
+        earlier = [t for t in times if t + period + self.periodic_bin <= now]
+        distances = []
+        for t in earlier:
+            i = bisect.bisect_left(times, t + period - self.periodic_bin)
+            nearest = [u for u in times[i:i + 4] if abs(u - t - period) <= self.periodic_bin]
+            if nearest:
+                distances.append(min(nearest, key=lambda u: abs(u - t - period)) - t)
+        if not distances:
+            return None
+        period = sorted(distances)[len(distances) // 2]
+        recurring = sum(1 for d in distances if abs(d - period) <= self.periodic_jitter)
+        if recurring < self.periodic_recurrence * len(earlier):
+            return None
+        return period
+
+    def _known_period(self, now):
+        """Return the cached period for the current URL pattern if it has not expired."""
+        entry = self.periodic_pages.get(self.url_pattern)
+        if entry and now - entry["at"] < self.periodic_ttl:
+            return entry["period"]
+        self.periodic_pages.pop(self.url_pattern, None)
+        return None
+
+    def _remember_period(self, period, now):
+        self.periodic_pages[self.url_pattern] = {"period": period, "at": now}
+
+    def predict_settle_delay(self, window, now=None):
+        """Predict seconds until `window` of silence is reached, using the rate model and learned profile.
+
+        The learned burst length describes page loads, so it only applies to the first burst
+        after a goto; a hover or toast burst on the same page is predicted from its own gaps.
+        """
+        now = now if now is not None else time.time()
+        last = self.last_entropy_time
+        expected_end = last
+        profile = self._settle_profile()
+        if self.load_burst and self.burst_start is not None and profile and profile.get("burstMs"):
+            # Learned: page loads here usually last burstMs from their first event
+            expected_end = max(expected_end, self.burst_start + profile["burstMs"] / 1000.0)
+        elif self.gap_ewma is not None and self.gap_ewma < window:
+            # Mid-burst: expect at least one more event one smoothed gap after the last
+            expected_end = max(expected_end, last + self.gap_ewma)
+        return max(0.0, expected_end + window - now)
 
     async def on_entropy(self, params):
         """Handle entropy stream events from Hub."""
         entropy_detected = params.get("entropy", False)
         if entropy_detected:
-            self.last_entropy_time = time.time()
+            now = time.time()
+            gap = now - self.last_entropy_time
+            if self.burst_start is None or gap >= self.settlement_window:
+                # Silence long enough to end the previous burst
+                if self.burst_start is not None:
+                    if self.load_burst:
+                        self._record_burst(self.last_entropy_time - self.burst_start)
+                    # Real animations never fall silent, so the noise was not periodic
+                    self.periodic_pages.pop(self.url_pattern, None)
+                self.burst_start = now
+                self.load_burst, self._expect_load = self._expect_load, False
+            else:
+                self.gap_ewma = self._ewma(self.gap_ewma, gap)
+            self.entropy_times.append(now)
+            self.last_entropy_time = now
             if self.is_stable:
                 print(f"[{self.layer}] Jitter Detected! Environment is UNSTABLE.")
             self.is_stable = False
+            
+            if self._hold:
+                period = self.detect_periodicity(now)
+                if period:
+                    self._remember_period(period, now)
+                    self._release_hold("periodic noise")
+                else:
+                    # Re-arm: the silence window restarts from this event
+                    self._push_timer.cancel()
+                    self._push_timer = asyncio.get_running_loop().call_later(
+                        self._hold["window"], self._release_hold, "settled")
 
     async def on_pre_check(self, params, msg_id):
         """Verify temporal stability before allowing command execution."""
@@ -47,6 +265,13 @@ class PulseSentinel(SentinelBase):
         selector = params.get("command", {}).get("selector", "")
         url = params.get("command", {}).get("url", "")
         cmd_key = goal or selector or url or cmd
+        if url:
+            self.url_pattern = self.url_pattern_for(url)
+        if cmd == "goto":
+            self._expect_load = True
+        
+        # A fresh pre_check supersedes any veto still being held
+        self._cancel_hold()
         
         # Reset veto count for new commands
         if cmd_key != self.current_command_id:
@@ -68,25 +293,44 @@ class PulseSentinel(SentinelBase):
              current_window = base_window
 
         # Proactively check stability
-        silence_duration = time.time() - self.last_entropy_time
+        now = time.time()
+        silence_duration = now - self.last_entropy_time
         if silence_duration >= current_window:
             if not self.is_stable:
                 print(f"[{self.layer}] Environment SETTLED for {cmd} ({silence_duration:.1f}s silence, Target: {current_window:.1f}s).")
+            self.periodic_pages.pop(self.url_pattern, None)
             self.is_stable = True
+        elif self._known_period(now):
+            print(f"[{self.layer}] Known periodic noise on {self.url_pattern}, treating as SETTLED for {cmd}.")
+            self.is_stable = True
+        else:
+            period = self.detect_periodicity(now)
+            if period:
+                print(f"[{self.layer}] PERIODIC NOISE detected ({period * 1000:.0f}ms period), treating as SETTLED for {cmd}.")
+                self._remember_period(period, now)
+                self.is_stable = True
         
         if self.is_stable:
             print(f"[{self.layer}] Stability Verified for: {cmd}")
             self.veto_count = 0
+            if self._profiles_dirty:
+                self._profiles_dirty = False
+                self._save_memory()
             await self.send_clear()
         elif self.veto_count >= self.max_veto_count:
             # Animation tolerance: force clear after max retries
             print(f"[{self.layer}] ANIMATION TOLERANCE: Max vetoes ({self.max_veto_count}) reached, force clearing for: {cmd}")
             self.veto_count = 0
             await self.send_clear()
+        elif self.push_mode:
+            self.veto_count += 1
+            delay = current_window - silence_duration
+            print(f"[{self.layer}] HOLDING veto for {cmd}: will push clear after {current_window:.1f}s of silence")
+            self._hold_veto(cmd, current_window, delay)
         else:
             self.veto_count += 1
-            wait_time = max(0.2, self.settlement_window - silence_duration)
-            print(f"[{self.layer}] VETO ({self.veto_count}/{self.max_veto_count}): Environment settling. Retry in {wait_time:.1f}s")
+            wait_time = max(0.05, self.predict_settle_delay(current_window))
+            print(f"[{self.layer}] VETO ({self.veto_count}/{self.max_veto_count}): Environment settling. Predicted settle in {wait_time:.2f}s")
             await self.send_wait(int(wait_time * 1000))
 
 if __name__ == "__main__":
@@ -7,15 +7,80 @@ Features persistent memory for learned remediation strategies.
 """
 
 import asyncio
+import json
+import re
 import sys
 import os
+import time
 import httpx
 
 # Path boilerplate for local imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sdk.starlight_sdk import SentinelBase
+from sdk.screenshot_cache import ScreenshotCache, dhash
+from sdk.imaging import preprocess_screenshot, union_bounds
+from sdk.pixel_heuristics import classify_screenshot
+from sdk.endpoint_pool import EndpointPool, NoHealthyEndpoint
+from sdk.micro_batcher import MicroBatcher
+
+OBSTACLE_KEYWORDS = ["popup", "modal", "banner", "overlay", "cookie", "dialog", "alert", "window", "obstacle"]
+
+
+def keyword_verdict(answer):
+    """First obstacle keyword (in priority order) mentioned in a model answer, or None."""
+    for kw in OBSTACLE_KEYWORDS:
+        if kw in answer:
+            return kw
+    return None
+
+
+class KeywordStreamMatcher:
+    """Incremental keyword matcher over streamed text.
+
+    Text is judged a sentence (or line) at a time: once a sentence is complete,
+    the first keyword in priority order found in it wins, as in the non-streaming
+    path, so "cookie banner" gives "cookie" in both modes. Obstacle keywords match
+    as substrings; "none" only counts as a whole word (not "nonetheless"), and only
+    when the sentence names no obstacle. Sentences with neither are skipped.
+    """
+
+    SENTENCE_END = re.compile(r"[.!?\n]")
+    NONE = re.compile(r"\bnone\b")
+
+    def __init__(self, keywords):
+        self.keywords = keywords  # Priority order
+        self.text = ""
+        self.start = 0  # Start of the sentence being read
+
+    def _judge(self, sentence):
+        for kw in self.keywords:
+            if kw in sentence:
+                return kw
+        return "none" if self.NONE.search(sentence) else None
+
+    def feed(self, text):
+        """Return the verdict of the first decisive sentence in the stream so far, or None."""
+        self.text += text.lower()
+        while True:
+            end = self.SENTENCE_END.search(self.text, self.start)
+            if not end:
+                return None
+            found = self._judge(self.text[self.start:end.start()])
+            self.start = end.end()
+            if found:
+                return found
+
+    def finish(self):
+        """Judge the unterminated last sentence at end of stream."""
+        found = self._judge(self.text[self.start:])
+        self.start = len(self.text)
+        return found
+
 
 class VisionSentinel(SentinelBase):
+    _FAILED = object()  # Inference error marker: never cached
+    _UNSUPPORTED = object()  # Backend has no batch endpoint
+
     def __init__(self):
         super().__init__(layer_name="VisionSentinel", priority=3)
         self.capabilities = ["vision"]
@@ -25,6 +90,104 @@ class VisionSentinel(SentinelBase):
         self.model = vision_config.get("model", "moondream")
         self.timeout = vision_config.get("timeout", 25)
         self.ollama_url = vision_config.get("ollamaUrl", "http://localhost:11434/api/generate")
+        # Stream tokens and stop as soon as the verdict is decided
+        self.stream = vision_config.get("stream", False)
+        # Resume once the page is quiet after remediation; the delay is only an upper bound
+        self.remediation_delay = vision_config.get("remediationDelayMs", 1000) / 1000.0
+        self.settle_quiet = vision_config.get("settleQuietMs", 200) / 1000.0
+        
+        # Inference backends: vision.endpoints balances across several, else the single ollamaUrl
+        breaker_config = vision_config.get("circuitBreaker", {})
+        self.pool = EndpointPool(
+            vision_config.get("endpoints") or [self.ollama_url],
+            failure_threshold=breaker_config.get("failureThreshold", 3),
+            cooldown=breaker_config.get("cooldownSeconds", 10),
+            slow_ms=breaker_config.get("slowMs")
+        )
+        self.health_check = vision_config.get("healthCheck", {})
+        
+        # One pooled keep-alive client per sentinel, with a cap on in-flight inferences per endpoint
+        self.max_concurrent = vision_config.get("maxConcurrent", 2) * len(self.pool.endpoints)
+        self._client = None
+        self._inference_slots = None  # Created lazily inside the running event loop
+        self.inference_stats = {"calls": 0, "inFlight": 0, "waiting": 0, "totalQueueMs": 0.0, "maxQueueMs": 0.0}
+        
+        # Micro-batching: screenshots arriving within windowMs share one batched backend call
+        batching_config = vision_config.get("batching", {})
+        self.batch_path = batching_config.get("path", "/api/generate_batch")
+        self.batch_supported = True
+        self.batcher = None
+        if batching_config.get("enabled", False):
+            self.batcher = MicroBatcher(
+                self._infer_batch,
+                window=batching_config.get("windowMs", 5) / 1000.0,
+                max_batch=batching_config.get("maxBatch", 4)
+            )
+        
+        # Shrink (and optionally crop) screenshots before inference
+        preprocess_config = vision_config.get("preprocess", {})
+        self.max_edge = preprocess_config.get("maxEdge", 768)
+        self.roi_crop = preprocess_config.get("roiCrop", False)
+        self.roi_margin = preprocess_config.get("roiMargin", 32)
+        self.jpeg_quality = preprocess_config.get("jpegQuality", 75)
+        
+        # Tier 1: NumPy pixel heuristics answer clear-cut screenshots; the rest go to the model (tier 2)
+        heuristics_config = vision_config.get("heuristics", {})
+        self.heuristics = heuristics_config.get("enabled", False)
+        self.heuristic_high = heuristics_config.get("highScore", 0.7)
+        self.heuristic_low = heuristics_config.get("lowScore", 0.15)
+        self.tier_stats = {
+            "pixels": {"calls": 0, "decided": 0, "totalMs": 0.0},
+            "model": {"calls": 0, "decided": 0, "totalMs": 0.0}
+        }
+        
+        self._in_flight = {}  # screenshot hash -> {"task", "waiters"}
+        self._active_check = None  # Task answering the Hub's current pre_check
+        
+        # Perceptual-hash verdict cache: near-duplicate page states skip inference
+        cache_config = vision_config.get("cache", {})
+        self.cache = None
+        if cache_config.get("enabled", False):
+            self.cache = ScreenshotCache(
+                max_distance=cache_config.get("maxDistance", 4),
+                ttl=cache_config.get("ttlSeconds", 300),
+                max_entries=cache_config.get("maxEntries", 256)
+            )
+        
+        # Speculative analysis: ask for a screenshot once the page settles and analyze it
+        # before the pre_check arrives; the Hub's pageVersion tells whether it is still current
+        speculative_config = vision_config.get("speculative", {})
+        self.speculative = speculative_config.get("enabled", False)
+        self.speculate_quiet = speculative_config.get("quietMs", 300) / 1000.0
+        self._settle_timer = None
+        self._speculation = None  # {"version", "task", "claimed"}
+        self.speculation_stats = {"started": 0, "used": 0, "discarded": 0}
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=float(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent,
+                    max_keepalive_connections=self.max_concurrent,
+                    keepalive_expiry=60.0
+                )
+            )
+        return self._client
+
+    def _get_slots(self):
+        if self._inference_slots is None:
+            self._inference_slots = asyncio.Semaphore(self.max_concurrent)
+        return self._inference_slots
+
+    async def on_shutdown(self):
+        if self._settle_timer is not None:
+            self._settle_timer.cancel()
+        self._discard_speculation()
+        await self.pool.stop_health_checks()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def on_pre_check(self, params, msg_id):
         screenshot_b64 = params.get("screenshot")
@@ -33,8 +196,28 @@ class VisionSentinel(SentinelBase):
             await self.send_clear()
             return
 
-        print(f"[{self.layer}] Starting AI Analysis ({self.timeout}s Budget)...")
-        obstacle = await self.analyze_screenshot(screenshot_b64)
+        # The Hub tracks one pending pre_check per sentinel: a newer one supersedes ours.
+        # Cancelling after the new waiter joins keeps a shared inference alive.
+        previous, self._active_check = self._active_check, asyncio.current_task()
+        
+        spec = self._speculation
+        if spec is not None and params.get("pageVersion") is not None and spec["version"] == params["pageVersion"]:
+            # Page unchanged since it settled: reuse the analysis that is already running (or done)
+            spec["claimed"] = True
+            self.speculation_stats["used"] += 1
+            state = "ready" if spec["task"].done() else "in progress"
+            print(f"[{self.layer}] Page v{spec['version']} unchanged since settle, speculative analysis {state}")
+            analysis = asyncio.shield(spec["task"])
+        else:
+            print(f"[{self.layer}] Starting AI Analysis ({self.timeout}s Budget)...")
+            analysis = asyncio.ensure_future(self.analyze_screenshot(screenshot_b64, params.get("blocking")))
+        if previous is not None and not previous.done():
+            previous.cancel()
+        try:
+            obstacle = await analysis
+        finally:
+            if self._active_check is asyncio.current_task():
+                self._active_check = None
         
         if obstacle:
             print(f"[{self.layer}] AI Success: Detected {obstacle}")
@@ -46,16 +229,67 @@ class VisionSentinel(SentinelBase):
                 target_selector = "button:has-text('Close') >> visible=true"
             
             await self.send_hijack(f"AI Vision detected: {obstacle}")
+            # The re-check after remediation must look again, not replay this verdict
+            self._forget_verdict(screenshot_b64)
+            clicked_at = time.monotonic()
             await self.send_action("click", target_selector)
             self.last_action = {"id": obstacle, "selector": target_selector}
             
-            await asyncio.sleep(1.0)
+            await self.wait_for_quiet(self.settle_quiet, self.remediation_delay, since=clicked_at)
             await self.send_resume(re_check=True)
         else:
             await self.send_clear()
 
+    def _forget_verdict(self, screenshot_b64):
+        if not self.cache:
+            return
+        try:
+            expired = self.cache.invalidate(dhash(screenshot_b64))
+        except Exception as e:
+            print(f"[{self.layer}] Warning: Could not invalidate cached verdict: {e}")
+            return
+        if expired:
+            print(f"[{self.layer}] Expired {expired} cached verdict(s) for the remediated page")
+
+    async def on_entropy(self, params):
+        if not self.speculative:
+            return
+        # The page changed: any speculation is stale, and the settle timer restarts
+        self._discard_speculation()
+        if self._settle_timer is not None:
+            self._settle_timer.cancel()
+        self._settle_timer = asyncio.get_running_loop().call_later(self.speculate_quiet, self._request_snapshot)
+
+    def _request_snapshot(self):
+        self._settle_timer = None
+        asyncio.ensure_future(self._send_msg("starlight.snapshot", {}))
+
+    def _discard_speculation(self):
+        spec, self._speculation = self._speculation, None
+        if spec is not None and not spec["claimed"] and not spec["task"].done():
+            spec["task"].cancel()  # Frees the inference slot unless a pre_check joined the flight
+            self.speculation_stats["discarded"] += 1
+
+    def _speculate(self, params):
+        version = params.get("pageVersion")
+        screenshot_b64 = params.get("screenshot")
+        if version is None or not screenshot_b64:
+            return
+        if self._speculation is not None and self._speculation["version"] == version:
+            return
+        self._discard_speculation()
+        self.speculation_stats["started"] += 1
+        print(f"[{self.layer}] Page v{version} settled, analyzing speculatively")
+        task = asyncio.ensure_future(self.analyze_screenshot(screenshot_b64))
+        self._speculation = {"version": version, "task": task, "claimed": False}
+
     async def on_message(self, method, params, msg_id):
         """Learn from command completion feedback."""
+        if method == "starlight.snapshot":
+            if self.speculative:
+                self._speculate(params)
+            return
+        
         m_type = params.get("type") if isinstance(params, dict) else None
         
         if m_type == "COMMAND_COMPLETE" and self.last_action:
@@ -68,42 +302,274 @@ class VisionSentinel(SentinelBase):
                     self._save_memory()
             self.last_action = None
 
-    async def analyze_screenshot(self, screenshot_b64):
+    async def analyze_screenshot(self, screenshot_b64, blocking=None):
+        try:
+            screen_hash = dhash(screenshot_b64)
+        except Exception as e:
+            print(f"[{self.layer}] Warning: Could not hash screenshot: {e}")
+            screen_hash = None
+        
+        if self.cache and screen_hash is not None:
+            found, verdict, distance = self.cache.lookup(screen_hash)
+            if found:
+                print(f"[{self.layer}] Cache HIT (distance {distance}): {verdict or 'none'} [hit rate {self.cache.hit_rate:.0%}]")
+                return verdict
+        
+        if screen_hash is None:
+            return await self._analyze_uncached(screenshot_b64, blocking, None)
+        
+        # Single-flight: equivalent screenshots share one in-flight inference
+        flight = self._in_flight.get(screen_hash)
+        if flight is None:
+            task = asyncio.ensure_future(self._analyze_uncached(screenshot_b64, blocking, screen_hash))
+            flight = self._in_flight[screen_hash] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _t, key=screen_hash, f=flight: self._end_flight(key, f))
+        else:
+            print(f"[{self.layer}] Joining in-flight analysis ({flight['waiters']} waiting)")
+        
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(flight["task"])
+        finally:
+            flight["waiters"] -= 1
+            # Abort only once every waiter has gone away
+            if flight["waiters"] == 0 and not flight["task"].done():
+                print(f"[{self.layer}] All waiters gone, cancelling analysis")
+                flight["task"].cancel()
+
+    def _end_flight(self, key, flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    async def _analyze_uncached(self, screenshot_b64, blocking, screen_hash):
+        if self.heuristics:
+            decided, verdict = await self._classify_pixels(screenshot_b64)
+            if decided:
+                if self.cache and screen_hash is not None:
+                    self.cache.store(screen_hash, verdict)
+                return verdict
+        
+        try:
+            roi = union_bounds(blocking) if self.roi_crop else None
+            image_b64 = await asyncio.to_thread(
+                preprocess_screenshot, screenshot_b64,
+                self.max_edge, roi, self.roi_margin, self.jpeg_quality
+            )
+        except Exception as e:
+            print(f"[{self.layer}] Warning: Preprocessing failed, sending full screenshot: {e}")
+            image_b64 = screenshot_b64
+        
+        started = time.monotonic()
+        verdict = await self._infer(image_b64)
+        self._record_tier("model", verdict is not self._FAILED, started)
+        if verdict is self._FAILED:
+            return None
+        if self.cache and screen_hash is not None:
+            self.cache.store(screen_hash, verdict)
+        return verdict
+
+    async def _classify_pixels(self, screenshot_b64):
+        """Tier 1: returns (decided, verdict); undecided screenshots escalate to the model."""
+        started = time.monotonic()
+        try:
+            decided, verdict, scores = await asyncio.to_thread(
+                classify_screenshot, screenshot_b64, self.heuristic_high, self.heuristic_low
+            )
+        except Exception as e:
+            print(f"[{self.layer}] Warning: Pixel heuristics failed, escalating: {e}")
+            decided, verdict, scores = False, None, {}
+        elapsed = self._record_tier("pixels", decided, started)
+        pixels = self.tier_stats["pixels"]
+        outcome = f"decided '{verdict or 'none'}'" if decided else "uncertain, escalating to model"
+        print(f"[{self.layer}] Tier 1 {outcome} in {elapsed:.0f}ms {scores} [hit rate {pixels['decided'] / pixels['calls']:.0%}]")
+        return decided, verdict
+
+    def _record_tier(self, tier, decided, started):
+        elapsed = (time.monotonic() - started) * 1000
+        stats = self.tier_stats[tier]
+        stats["calls"] += 1
+        stats["decided"] += bool(decided)
+        stats["totalMs"] += elapsed
+        return elapsed
+
+    def tier_report(self):
+        """Per-tier hit rate (share of calls that produced a verdict) and average latency."""
+        return {
+            tier: {
+                "calls": st["calls"],
+                "hitRate": round(st["decided"] / st["calls"], 3) if st["calls"] else 0.0,
+                "avgMs": round(st["totalMs"] / st["calls"], 1) if st["calls"] else 0.0
+            }
+            for tier, st in self.tier_stats.items()
+        }
+
+    async def _infer(self, screenshot_b64):
+        if self.batcher is not None:
+            return await self.batcher.submit(screenshot_b64)
+        return await self._run_inference([screenshot_b64])
+
+    async def _infer_batch(self, images):
+        """MicroBatcher handler: one verdict (or _FAILED) per image, in order."""
+        if len(images) > 1 and self.batch_supported:
+            verdicts = await self._run_inference(images, self._generate_batch)
+            if verdicts is self._FAILED:
+                return [self._FAILED] * len(images)
+            if verdicts is not self._UNSUPPORTED:
+                print(f"[{self.layer}] Batched {len(images)} screenshots in one call (avg batch {self.batcher.avg_batch_size:.1f})")
+                return verdicts
+        # Single item, or no batch endpoint: one call per screenshot
+        return await asyncio.gather(*(self._run_inference([image]) for image in images))
+
+    async def _run_inference(self, images, generate=None):
         prompt = "What is the main obstacle in this image? (popup, modal, banner, or none)"
+        stats = self.inference_stats
+        if self.health_check.get("enabled", False):
+            self.pool.start_health_checks(
+                self._get_client(),
+                self.health_check.get("path", "/api/tags"),
+                self.health_check.get("intervalSeconds", 10)
+            )
         try:
-            async with httpx.AsyncClient(timeout=float(self.timeout)) as client:
-                response = await client.post(
-                    self.ollama_url,
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "images": [screenshot_b64],
-                        "stream": False
-                    }
-                )
-                
-                if response.status_code == 200:
-                    answer = response.json().get("response", "").strip().lower()
-                    print(f"[{self.layer}] AI Raw Response: '{answer}'")
-                    
-                    keywords = ["popup", "modal", "banner", "overlay", "cookie", "dialog", "alert", "window", "obstacle"]
-                    for kw in keywords:
-                        if kw in answer: 
-                            return kw
-                    return None
+            queued_at = time.monotonic()
+            stats["waiting"] += 1
+            try:
+                await self._get_slots().acquire()
+            finally:
+                stats["waiting"] -= 1
+            queue_ms = (time.monotonic() - queued_at) * 1000
+            stats["calls"] += 1
+            stats["totalQueueMs"] += queue_ms
+            stats["maxQueueMs"] = max(stats["maxQueueMs"], queue_ms)
+            stats["inFlight"] += 1
+            if queue_ms >= 1:
+                print(f"[{self.layer}] Inference queued {queue_ms:.0f}ms (avg {stats['totalQueueMs'] / stats['calls']:.0f}ms, max {stats['maxQueueMs']:.0f}ms)")
+            payload = {
+                "model": self.model,
+                "prompt": prompt,
+                "images": images,
+                "stream": self.stream and generate is None
+            }
+            try:
+                return await self._generate_balanced(payload, generate)
+            finally:
+                stats["inFlight"] -= 1
+                self._get_slots().release()
         except httpx.TimeoutException:
             print(f"[{self.layer}] AI Analysis timed out after {self.timeout}s")
             await self.update_context({"vision_status": "TIMEOUT", "reason": f"Analysis exceeded {self.timeout}s"})
-        except httpx.ConnectError:
-            print(f"[{self.layer}] ERROR: Cannot connect to Ollama at {self.ollama_url}")
+        except (httpx.ConnectError, NoHealthyEndpoint) as e:
+            urls = ", ".join(ep.url for ep in self.pool.endpoints)
+            print(f"[{self.layer}] ERROR: Cannot reach Ollama at {urls}: {e}")
             print(f"[{self.layer}] HINT: Run 'ollama serve' to start the AI backend")
             await self.update_context({"vision_status": "OFFLINE", "reason": "Ollama unavailable"})
         except Exception as e:
             print(f"[{self.layer}] AI Analysis failed: {type(e).__name__}: {e}")
             await self.update_context({"vision_status": "ERROR", "reason": str(e)})
         
+        return self._FAILED
+
+    async def _generate_balanced(self, payload, generate=None):
+        """Send to the least-loaded healthy endpoint, failing over to the next on errors."""
+        if generate is None:
+            generate = self._generate_streaming if self.stream else self._generate
+        tried = []
+        while True:
+            try:
+                ep = self.pool.acquire(exclude=tried)
+            except NoHealthyEndpoint:
+                if tried:
+                    return self._FAILED
+                raise
+            tried.append(ep)
+            started = time.monotonic()
+            ok = None  # Stays None if cancelled: abandoned calls say nothing about health
+            try:
+                verdict = await generate(ep.url, payload)
+                ok = verdict is not self._FAILED
+            except httpx.ConnectError:
+                ok = False
+                if len(tried) >= len(self.pool.endpoints):
+                    raise
+                verdict = self._FAILED
+            except Exception:
+                ok = False
+                raise
+            finally:
+                latency_ms = (time.monotonic() - started) * 1000 if ok is not None else None
+                self.pool.release(ep, ok, latency_ms)
+            if ok or len(tried) >= len(self.pool.endpoints):
+                return verdict
+            print(f"[{self.layer}] Endpoint {ep.url} failed, failing over...")
+
+    def endpoint_stats(self):
+        """Per-endpoint circuit state, load and latency."""
+        return self.pool.stats()
+
+    async def _generate(self, url, payload):
+        response = await self._get_client().post(url, json=payload)
+        if response.status_code != 200:
+            print(f"[{self.layer}] AI backend {url} returned HTTP {response.status_code}")
+            return self._FAILED
+        
+        answer = response.json().get("response", "").strip().lower()
+        print(f"[{self.layer}] AI Raw Response: '{answer}'")
+        return keyword_verdict(answer)
+
+    async def _generate_batch(self, url, payload):
+        """POST several images to the endpoint's batch path; expects {"responses": [...]}, one per image.
+
+        Plain Ollama has no batch route: a 404 (or a non-batch answer) switches batching off and callers fall back to single calls.
+        """
+        batch_url = EndpointPool.url_with_path(url, self.batch_path)
+        response = await self._get_client().post(batch_url, json=payload)
+        if response.status_code not in (200, 404, 405, 501):
+            print(f"[{self.layer}] AI backend {batch_url} returned HTTP {response.status_code}")
+            return self._FAILED
+        answers = response.json().get("responses") if response.status_code == 200 else None
+        if not isinstance(answers, list):
+            print(f"[{self.layer}] {batch_url} does not support batching, sending screenshots one by one")
+            self.batch_supported = False
+            return self._UNSUPPORTED
+        
+        if len(answers) != len(payload["images"]):
+            print(f"[{self.layer}] Batch answer count mismatch: {len(answers)} for {len(payload['images'])} images")
+            return self._FAILED
+        verdicts = []
+        for answer in answers:
+            answer = str(answer).strip().lower()
+            print(f"[{self.layer}] AI Raw Response: '{answer}'")
+            verdicts.append(keyword_verdict(answer))
+        return verdicts
+
+    async def _generate_streaming(self, url, payload):
+        """Stream tokens from Ollama and stop at the first sentence naming an obstacle (or "none")."""
+        matcher = KeywordStreamMatcher(OBSTACLE_KEYWORDS)
+        started = time.monotonic()
+        answer = []
+        async with self._get_client().stream("POST", url, json=payload) as response:
+            if response.status_code != 200:
+                print(f"[{self.layer}] AI backend {url} returned HTTP {response.status_code}")
+                return self._FAILED
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                answer.append(token)
+                found = matcher.feed(token)
+                if found is None and chunk.get("done"):
+                    found = matcher.finish()
+                if found is not None:
+                    # Leaving the context manager closes the stream and aborts generation
+                    elapsed = (time.monotonic() - started) * 1000
+                    print(f"[{self.layer}] AI Stream verdict '{found}' after {elapsed:.0f}ms: '{''.join(answer).strip()}'")
+                    return None if found == "none" else found
+                if chunk.get("done"):
+                    break
+        print(f"[{self.layer}] AI Raw Response: '{''.join(answer).strip().lower()}'")
         return None
 
+
 if __name__ == "__main__":
     sentinel = VisionSentinel()
     asyncio.run(sentinel.start())
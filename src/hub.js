@@ -1,6 +1,7 @@
 const { chromium } = require('playwright');
 const { WebSocketServer, WebSocket } = require('ws');
 const { nanoid } = require('nanoid');
+const crypto = require('crypto');
 const fs = require('fs');
 const path = require('path');
 const TelemetryEngine = require('./telemetry');
@@ -19,6 +20,32 @@ function escapeHtml(str) {
         .replace(/"/g, '&quot;')
         .replace(/'/g, '&#39;');
 }
+
+const isPlainObject = (v) => v !== null && typeof v === 'object' && !Array.isArray(v);
+
+// JSON-Patch style ops (add/replace/remove by JSON Pointer) turning `prev` into `next`.
+// Plain objects are diffed key by key; arrays and scalars are replaced whole.
+function contextDiff(prev, next, pointer = '', ops = []) {
+    for (const key of Object.keys(prev)) {
+        if (!(key in next)) ops.push({ op: 'remove', path: `${pointer}/${escapePointer(key)}` });
+    }
+    for (const [key, value] of Object.entries(next)) {
+        const path = `${pointer}/${escapePointer(key)}`;
+        if (!(key in prev)) {
+            ops.push({ op: 'add', path, value });
+        } else if (isPlainObject(prev[key]) && isPlainObject(value)) {
+            contextDiff(prev[key], value, path, ops);
+        } else if (JSON.stringify(prev[key]) !== JSON.stringify(value)) {
+            ops.push({ op: 'replace', path, value });
+        }
+    }
+    return ops;
+}
+
+function escapePointer(key) {
+    return String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+}
+
 class CBAHub {
     constructor(port = 8080, headless = false) {
         // Load configuration
@@ -34,6 +61,7 @@ class CBAHub {
             if (req.url === '/health') {
                 const status = {
                     status: 'healthy',
+                    ready: !!this.ready,  // Browser and page are up: intents can start
                     version: '3.0.3',
                     protocol: 'starlight/1.0.0',
                     uptime: process.uptime(),
@@ -87,13 +115,19 @@ class CBAHub {
         this.totalSavedTime = 0;
         this.hijackStarts = new Map();
         this.lastEntropyBroadcast = 0;
+        this.pageVersion = 0;  // Bumped on every DOM mutation/navigation: identifies a page state
+        this.queryCache = { version: -1, results: new Map() };  // starlight.query answers for one page version
+        this.pageTextSnapshot = null;  // Text sent with the last pre_check: redaction offsets refer to it
+        this.redaction = { selectors: [], texts: [], scrubValues: new Set(), scrubPattern: null };
         this.sovereignState = {};
+        this.contextVersion = 0;  // Bumped on every effective sovereign state change
         this.missionTrace = [];
         this.historicalMemory = new Map();
         this.historicalAuras = new Set();
         this.missionStartTime = null;
         this.isProcessing = false;
         this.isShuttingDown = false;
+        this.ready = false;  // Set once the browser page is up; queued commands wait for it
         this.recorder = new ActionRecorder();  // Phase 13.5: Test Recorder
 
         if (!fs.existsSync(this.screenshotsDir)) fs.mkdirSync(this.screenshotsDir);
@@ -191,12 +225,6 @@ class CBAHub {
             console.log(`[CBA Hub] WebSocket/HTTP Server listening on port ${this.port}`);
         });
 
-        this.browser = await chromium.launch({ headless: this.headless });
-        this.page = await this.browser.newPage();
-
-        // Phase 9: Traffic Sovereign - Network Interception
-        await this.setupNetworkInterception();
-
         this.wss.on('connection', (ws) => {
             const id = nanoid();
             ws.on('message', async (data) => {
@@ -218,10 +246,19 @@ class CBAHub {
             ws.on('close', () => this.handleDisconnect(id));
         });
 
+        this.browser = await chromium.launch({ headless: this.headless });
+        this.page = await this.browser.newPage();
+
+        // Phase 9: Traffic Sovereign - Network Interception
+        await this.setupNetworkInterception();
+
         setInterval(() => this.checkSystemHealth(), 1000);
 
         // Setup the initial page with all handlers
         await this.setupPage();
+        // Clients may connect while the browser starts; their commands run from here
+        this.ready = true;
+        this.processQueue();
     }
 
     /**
@@ -236,6 +273,8 @@ class CBAHub {
             await dialog.dismiss();
         });
 
+        this.page.on('framenavigated', () => { this.pageVersion++; });
+
         // v2.0 Phase 3: Network Entropy Tracking
         this.page.on('request', () => this.broadcastEntropy());
         this.page.on('requestfinished', () => this.broadcastEntropy());
@@ -256,6 +295,20 @@ class CBAHub {
                             }
                         });
                     }
+                    // Report detached elements so sentinels can confirm an obstacle is gone
+                    for (const removed of mutation.removedNodes) {
+                        if (removed.nodeType !== 1) continue;
+                        window.onMutation({
+                            type: 'dom_mutation',
+                            removed: true,
+                            target: {
+                                tagName: removed.tagName,
+                                className: typeof removed.className === 'string' ? removed.className : '',
+                                id: removed.id,
+                                visibility: 'none'
+                            }
+                        });
+                    }
                 }
             });
             window.addEventListener('load', () => {
@@ -269,6 +322,7 @@ class CBAHub {
         try {
             await this.page.exposeFunction('onMutation', (mutation) => {
                 // v2.0 Phase 3: Broadcast entropy on mutation
+                this.pageVersion++;
                 this.broadcastEntropy();
                 this.broadcastMutation(mutation);
             });
@@ -286,7 +340,7 @@ class CBAHub {
         const msgObj = {
             jsonrpc: '2.0',
             method: 'starlight.entropy_stream',
-            params: { entropy: true },
+            params: { entropy: true, pageVersion: this.pageVersion },
             id: nanoid()
         };
         const msg = JSON.stringify(msgObj);
@@ -466,18 +520,46 @@ class CBAHub {
             this.historicalAuras.has(bucket - 1);
     }
 
-    broadcastContextUpdate() {
-        const msg = JSON.stringify({
+    /**
+     * Publish a sovereign state change. Sentinels that registered with `contextDeltas`
+     * receive only the ops; other clients (Intent scripts, older SDKs) get the full state.
+     */
+    broadcastContextUpdate(ops) {
+        const deltaClients = new Set();
+        for (const s of this.sentinels.values()) {
+            if (s.contextDeltas) deltaClients.add(s.ws);
+        }
+        let full = null;
+        const delta = JSON.stringify({
             jsonrpc: '2.0',
-            method: 'starlight.sovereign_update',
-            params: { context: this.sovereignState },
+            method: 'starlight.context_delta',
+            params: { version: this.contextVersion, baseVersion: this.contextVersion - 1, ops },
             id: nanoid()
         });
         for (const ws of this.wss.clients) {
-            if (ws.readyState === WebSocket.OPEN) ws.send(msg);
+            if (ws.readyState !== WebSocket.OPEN) continue;
+            if (deltaClients.has(ws)) {
+                ws.send(delta);
+            } else {
+                full = full || this.contextSnapshotMessage();
+                ws.send(full);
+            }
         }
     }
 
+    contextSnapshotMessage() {
+        return JSON.stringify({
+            jsonrpc: '2.0',
+            method: 'starlight.sovereign_update',
+            params: { context: this.sovereignState, version: this.contextVersion },
+            id: nanoid()
+        });
+    }
+
+    sendContextSnapshot(ws) {
+        if (ws.readyState === WebSocket.OPEN) ws.send(this.contextSnapshotMessage());
+    }
+
     async recordTrace(type, sentinelId, data, includeSnapshot = false) {
         if (data.method === 'starlight.pulse') return;
         const sentinel = this.sentinels.get(sentinelId);
@@ -550,9 +632,12 @@ class CBAHub {
                     priority: params.priority,
                     selectors: params.selectors,
                     capabilities: params.capabilities,
+                    contextDeltas: params.contextDeltas === true,
                     protocolVersion: params.version || '1.0.0'
                 });
                 console.log(`[CBA Hub] Registered Sentinel: ${params.layer} (Priority: ${params.priority})`);
+                // Delta subscribers start their replica from the current snapshot
+                if (params.contextDeltas === true) this.sendContextSnapshot(ws);
                 break;
             case 'starlight.pulse':
                 if (sentinel) {
@@ -564,10 +649,19 @@ class CBAHub {
                 // Phase 4: Context Injection from Sentinels
                 if (params.context) {
                     console.log(`[CBA Hub] Context Injection from ${sentinel?.layer || 'Unknown'}:`, params.context);
-                    this.sovereignState = { ...this.sovereignState, ...params.context };
-                    this.broadcastContextUpdate();
+                    const next = { ...this.sovereignState, ...params.context };
+                    const ops = contextDiff(this.sovereignState, next);
+                    this.sovereignState = next;
+                    if (ops.length > 0) {
+                        this.contextVersion++;
+                        this.broadcastContextUpdate(ops);
+                    }
                 }
                 break;
+            case 'starlight.context_sync':
+                // A delta subscriber missed a version: resend the full state
+                this.sendContextSnapshot(ws);
+                break;
             case 'starlight.clear':
                 if (this.pendingRequests.has(id)) {
                     this.pendingRequests.get(id).resolve(msg);
@@ -580,6 +674,15 @@ class CBAHub {
                     this.pendingRequests.delete(id);
                 }
                 break;
+            case 'starlight.snapshot':
+                await this.handleSnapshotRequest(id, ws);
+                break;
+            case 'starlight.redact':
+                this.handleRedact(id, params);
+                break;
+            case 'starlight.query':
+                await this.handleQuery(id, ws, msg);
+                break;
             case 'starlight.hijack':
                 await this.handleHijack(id, params);
                 break;
@@ -804,12 +907,220 @@ class CBAHub {
         });
     }
 
+    /**
+     * Speculative analysis: a vision-capable sentinel asks for the current screenshot
+     * once the page has settled, tagged with the page version it shows.
+     */
+    async handleSnapshotRequest(id, ws) {
+        const sentinel = this.sentinels.get(id);
+        if (!sentinel?.capabilities?.includes('vision') || this.isShuttingDown) return;
+        if (!this.page || this.page.isClosed()) return;
+        const pageVersion = this.pageVersion;
+        try {
+            const screenshotBuffer = await this.page.screenshot({ type: 'jpeg', quality: 80, mask: this.redactionMasks() });
+            if (ws.readyState !== WebSocket.OPEN) return;
+            ws.send(JSON.stringify({
+                jsonrpc: '2.0',
+                method: 'starlight.snapshot',
+                params: { screenshot: screenshotBuffer.toString('base64'), pageVersion },
+                id: nanoid()
+            }));
+        } catch (e) {
+            console.warn(`[CBA Hub] Snapshot for ${sentinel.layer} failed:`, e.message);
+        }
+    }
+
+    /**
+     * PII redact mode: a pii-detection sentinel reports where PII sits, as UTF-16 offsets
+     * into the last pre_check's page text and into blocking elements' text (by index).
+     * The Hub resolves them once into screenshot masks and a trace scrub pattern.
+     * A range whose text does not match its digest is dropped rather than trusted.
+     *
+     * The pre_check screenshot reaches sentinels before any mask for that page exists;
+     * only the traced copy is re-captured with the mask applied.
+     */
+    handleRedact(id, params) {
+        const sentinel = this.sentinels.get(id);
+        if (!sentinel?.capabilities?.includes('pii-detection')) return;
+        const snapshot = this.pageTextSnapshot;
+        if (!snapshot || params.pageVersion !== snapshot.version) {
+            console.warn(`[CBA Hub] Ignoring stale redaction from ${sentinel.layer} (page v${params.pageVersion})`);
+            return;
+        }
+
+        const selectors = new Set();
+        const texts = new Set();
+        let mismatched = 0;
+        const resolve = (text, range) => {
+            const value = text?.slice(range.start, range.end);
+            if (!value) return null;
+            if (range.digest && crypto.createHash('sha256').update(value).digest('hex').slice(0, 16) !== range.digest) {
+                mismatched++;
+                return null;
+            }
+            return value;
+        };
+        for (const range of params.page || []) {
+            const value = resolve(snapshot.text, range);
+            if (value) texts.add(value);
+        }
+        for (const range of params.elements || []) {
+            // Selectors are shared patterns: the index picks the element the offsets refer to
+            const element = Number.isInteger(range.index) ? snapshot.blocking[range.index]
+                : snapshot.blocking.find(b => b.selector === range.selector);
+            if (!element) continue;
+            selectors.add(element.selector);
+            const value = resolve(element.text, range);
+            if (value) texts.add(value);
+        }
+        if (mismatched) {
+            console.warn(`[CBA Hub] Dropped ${mismatched} redaction ranges from ${sentinel.layer} that did not match the page text`);
+        }
+
+        const maxMasks = this.config.pii?.maxMasks || 50;
+        this.redaction.selectors = [...selectors].slice(0, maxMasks);
+        this.redaction.texts = [...texts].slice(0, maxMasks);
+        // Values seen during the whole mission are scrubbed from the saved trace
+        const before = this.redaction.scrubValues.size;
+        texts.forEach(t => this.redaction.scrubValues.add(t));
+        if (this.redaction.scrubValues.size !== before) {
+            const escaped = [...this.redaction.scrubValues]
+                .sort((a, b) => b.length - a.length)
+                .map(v => v.replace(/[.*+?^${}()|[\]\\]/g, '\\$&'));
+            this.redaction.scrubPattern = new RegExp(escaped.join('|'), 'g');
+        }
+        if (selectors.size || texts.size) {
+            console.log(`[CBA Hub] Redaction mask from ${sentinel.layer}: ${selectors.size} elements, ${texts.size} text spans`);
+            this.remaskTracedScreenshot(snapshot);
+        }
+    }
+
+    /**
+     * Replace the unmasked screenshot recorded with a pre_check, once a mask for its page exists.
+     */
+    async remaskTracedScreenshot(snapshot) {
+        const params = snapshot.params;
+        if (!params?.screenshot) return;
+        if (!this.page || this.page.isClosed() || this.pageVersion !== snapshot.version) {
+            params.screenshot = null;  // The page moved on: drop the unmasked image rather than keep it
+            return;
+        }
+        try {
+            const buffer = await this.page.screenshot({ type: 'jpeg', quality: 80, mask: this.redactionMasks() });
+            params.screenshot = buffer.toString('base64');
+        } catch (e) {
+            params.screenshot = null;
+            console.warn('[CBA Hub] Re-masking pre_check screenshot failed:', e.message);
+        }
+    }
+
+    /**
+     * Answer a batch of DOM queries in one round trip. Results are cached per page version,
+     * so sentinels asking the same thing about the same page share one evaluation.
+     * The reply echoes the request id for correlation.
+     */
+    async handleQuery(id, ws, msg) {
+        if (!this.sentinels.has(id)) return;
+        const maxBatch = this.config.hub?.queryMaxBatch || 64;
+        const queries = (Array.isArray(msg.params.queries) ? msg.params.queries : []).slice(0, maxBatch);
+        const pageVersion = this.pageVersion;
+        if (this.queryCache.version !== pageVersion) {
+            this.queryCache = { version: pageVersion, results: new Map() };
+        }
+        const cache = this.queryCache.results;
+        const keys = queries.map(q => JSON.stringify([q.kind, q.selector ?? null, q.name ?? null]));
+        const missing = [...new Set(keys.filter(k => !cache.has(k)))];
+        const answered = new Map();
+
+        if (missing.length > 0) {
+            let answers;
+            if (!this.page || this.page.isClosed() || this.isShuttingDown) {
+                answers = missing.map(() => ({ error: 'No active page' }));
+            } else {
+                try {
+                    answers = await this.page.evaluate(({ queries, maxText }) => {
+                        // 'a >>> b' descends into the shadow root of each 'a' match
+                        const findAll = (selector) => {
+                            const parts = selector.split('>>>').map(p => p.trim());
+                            let roots = [document];
+                            for (const part of parts.slice(0, -1)) {
+                                roots = roots.flatMap(r => [...r.querySelectorAll(part)]).map(el => el.shadowRoot).filter(Boolean);
+                            }
+                            return roots.flatMap(r => [...r.querySelectorAll(parts[parts.length - 1])]);
+                        };
+                        const isVisible = (el) => {
+                            const style = window.getComputedStyle(el);
+                            const rect = el.getBoundingClientRect();
+                            return style.display !== 'none' && style.visibility !== 'hidden' && rect.width > 0 && rect.height > 0;
+                        };
+                        return queries.map(([kind, selector, name]) => {
+                            try {
+                                if (kind === 'title') return { value: document.title };
+                                if (kind === 'url') return { value: location.href };
+                                if (typeof selector !== 'string' || !selector) return { error: `'${kind}' needs a selector` };
+                                const matches = findAll(selector);
+                                if (kind === 'count') return { value: matches.length };
+                                if (kind === 'rects') {
+                                    return { value: matches.filter(isVisible).map(m => {
+                                        const r = m.getBoundingClientRect();
+                                        return { x: r.x, y: r.y, width: r.width, height: r.height };
+                                    }) };
+                                }
+                                const el = matches[0];
+                                if (kind === 'visible') return { value: !!el && isVisible(el) };
+                                if (!el) return { value: null };
+                                if (kind === 'text') return { value: (el.innerText || '').slice(0, maxText) };
+                                if (kind === 'attribute') return { value: el.getAttribute(name) };
+                                if (kind === 'rect') {
+                                    const r = el.getBoundingClientRect();
+                                    return { value: { x: r.x, y: r.y, width: r.width, height: r.height } };
+                                }
+                                return { error: `Unknown query kind '${kind}'` };
+                            } catch (e) {
+                                return { error: e.message };
+                            }
+                        });
+                    }, { queries: missing.map(k => JSON.parse(k)), maxText: this.config.hub?.blockingTextMax || 2000 });
+                } catch (e) {
+                    answers = missing.map(() => ({ error: e.message }));
+                }
+            }
+            // Only keep answers that still describe the cached page version
+            const fresh = this.pageVersion === pageVersion && this.queryCache.results === cache;
+            missing.forEach((k, i) => {
+                answered.set(k, answers[i]);
+                if (fresh && !answers[i].error) cache.set(k, answers[i]);
+            });
+        }
+
+        if (ws.readyState !== WebSocket.OPEN) return;
+        ws.send(JSON.stringify({
+            jsonrpc: '2.0',
+            method: 'starlight.query',
+            params: { pageVersion, results: keys.map(k => answered.get(k) || cache.get(k)) },
+            id: msg.id
+        }));
+    }
+
+    redactionMasks() {
+        if (!this.page || this.page.isClosed()) return [];
+        return [
+            ...this.redaction.selectors.map(sel => this.page.locator(sel)),
+            ...this.redaction.texts.map(text => this.page.getByText(text))
+        ];
+    }
+
+    scrubRedacted(text) {
+        const pattern = this.redaction.scrubPattern;
+        return pattern ? text.replace(pattern, m => '*'.repeat(m.length)) : text;
+    }
+
     async takeScreenshot(name) {
         const filename = `${Date.now()}_${name}.png`;
         const filepath = path.join(this.screenshotsDir, filename);
         if (this.page && !this.page.isClosed()) {
             try {
-                await this.page.screenshot({ path: filepath });
+                await this.page.screenshot({ path: filepath, mask: this.redactionMasks() });
                 return filename;
             } catch (e) { return null; }
         }
@@ -897,7 +1208,7 @@ class CBAHub {
     async processQueue() {
         // Don't process if shutting down
         if (this.isShuttingDown) return;
-        if (this.isLocked || this.commandQueue.length === 0 || !this.systemHealthy || this.isProcessing) return;
+        if (!this.ready || this.isLocked || this.commandQueue.length === 0 || !this.systemHealthy || this.isProcessing) return;
 
         if (!this.missionStartTime) this.missionStartTime = Date.now();
 
@@ -1000,11 +1311,25 @@ class CBAHub {
 
         const allSelectors = [...new Set(relevantSentinels.flatMap(([id, s]) => s.selectors || []))];
 
+        // Playwright scrolls the target into view before acting, so measure the page as the
+        // action will see it: a fixed modal only covers a below-the-fold target after the scroll
+        if (msg.selector && (msg.cmd === 'click' || msg.cmd === 'fill')) {
+            try {
+                await this.page.locator(msg.selector).first().scrollIntoViewIfNeeded({ timeout: 1000 });
+            } catch (e) {
+                // Missing or hidden target: the command itself will report it
+            }
+        }
+
         // v2.0 Phase 2: Add AI context (screenshot) if deep analysis is capability-flagged
         let screenshotB64 = null;
+        const pageVersion = this.pageVersion;
+        // Scrolls and unreported mutations do not move pageVersion: answers cached before
+        // this pre_check are not reused for it
+        this.queryCache = { version: pageVersion, results: new Map() };
         if (relevantSentinels.some(([id, s]) => s.capabilities?.includes('vision'))) {
             try {
-                const screenshotBuffer = await this.page.screenshot({ type: 'jpeg', quality: 80 });
+                const screenshotBuffer = await this.page.screenshot({ type: 'jpeg', quality: 80, mask: this.redactionMasks() });
                 screenshotB64 = screenshotBuffer.toString('base64');
                 console.log(`[CBA Hub] Screenshot captured for AI analysis (${Math.round(screenshotB64.length / 1024)}KB)`);
             } catch (e) {
@@ -1016,7 +1341,7 @@ class CBAHub {
         const shadowEnabled = this.config.hub?.shadowDom?.enabled !== false;
         const maxDepth = this.config.hub?.shadowDom?.maxDepth || 5;
 
-        const blockingElements = await this.page.evaluate(({ selectors, shadowEnabled, maxDepth }) => {
+        const blockingElements = await this.page.evaluate(({ selectors, shadowEnabled, maxDepth, maxText }) => {
             const results = [];
 
             // Helper: Recursively search elements including shadow roots
@@ -1084,13 +1409,15 @@ class CBAHub {
                             className: typeof el.className === 'string' ? el.className : '',
                             display: style.display,
                             rect: `${Math.round(rect.width)}x${Math.round(rect.height)}`,
+                            bounds: { x: rect.x, y: rect.y, width: rect.width, height: rect.height },
+                            text: (el.innerText || '').slice(0, maxText),
                             inShadow: !!shadowSelector
                         });
                     }
                 });
             });
             return results;
-        }, { selectors: allSelectors, shadowEnabled, maxDepth });
+        }, { selectors: allSelectors, shadowEnabled, maxDepth, maxText: this.config.hub?.blockingTextMax || 2000 });
 
         // Phase 9: Extract page text for PII detection
         let pageText = '';
@@ -1102,8 +1429,9 @@ class CBAHub {
                 console.warn('[CBA Hub] Page text extraction failed:', e.message);
             }
         }
+        this.pageTextSnapshot = { version: pageVersion, text: pageText, blocking: blockingElements, params: null };
 
-        // Get target element rect if we have a selector (for overlap checking)
+        // Get target element rect if we have a selector (for overlap checking), after the scroll above
         let targetRect = null;
         if (msg.selector) {
             try {
@@ -1119,16 +1447,21 @@ class CBAHub {
         }
 
         // Standardize broadcast
+        const preCheckParams = {
+            command: msg,
+            blocking: blockingElements,
+            targetRect: targetRect,  // For obstacle overlap checking
+            viewport: this.page.viewportSize(),
+            screenshot: screenshotB64,
+            pageVersion: pageVersion,
+            page_text: pageText
+        };
+        // The traced copy of these params gets a re-masked screenshot if PII is reported
+        this.pageTextSnapshot.params = preCheckParams;
         this.broadcast({
             jsonrpc: '2.0',
             method: 'starlight.pre_check',
-            params: {
-                command: msg,
-                blocking: blockingElements,
-                targetRect: targetRect,  // For obstacle overlap checking
-                screenshot: screenshotB64,
-                page_text: pageText
-            },
+            params: preCheckParams,
             id: nanoid()
         });
 
@@ -1488,7 +1821,9 @@ class CBAHub {
     async saveMissionTrace() {
         console.log(`[CBA Hub]Saving Mission Trace(${this.missionTrace.length} events)...`);
         const traceFile = path.join(process.cwd(), 'mission_trace.json');
-        fs.writeFileSync(traceFile, JSON.stringify(this.missionTrace, null, 2));
+        // Scrub raw string values (before JSON escaping) of any PII reported in redact mode
+        const scrub = (key, value) => typeof value === 'string' ? this.scrubRedacted(value) : value;
+        fs.writeFileSync(traceFile, JSON.stringify(this.missionTrace, scrub, 2));
         console.log("[CBA Hub] Mission Trace saved to mission_trace.json");
     }
 }